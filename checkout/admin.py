@@ -159,6 +159,30 @@ class ReservationAdmin(admin.ModelAdmin):
         return qs.filter(site_inventory__site=request.user.site)
 
 
+# noinspection PyMethodMayBeStatic
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(SuperuserOnlyAdmin):
+    date_hierarchy = 'date'
+    list_display = ('date', 'site_inventory', 'period', 'classroom', 'units', 'team')
+    list_filter = ('date',)
+    readonly_fields = ('id', 'team', 'site_inventory', 'classroom', 'date', 'period', 'units', 'purpose',
+                       'collaborative', 'creator', 'comment', 'created', 'modified')
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(SuperuserOnlyAdmin):
+    list_display = ('pk', 'created', 'requested_by', 'format', 'status', 'rows_written', 'rows_total')
+    list_filter = ('status',)
+    readonly_fields = ('requested_by', 'filters', 'format', 'rows_total', 'rows_written', 'file_name', 'error',
+                       'created', 'started', 'finished')
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(SiteInventory)
 class SiteInventoryAdmin(SuperuserOnlyAdmin):
     list_display = ('inventory__display_name', 'inventory__type__name', 'units_display', 'site', 'storage_location')
@@ -434,7 +458,7 @@ class SiteAdmin(SuperuserOnlyAdmin):
     def reservations(self, site: Site):
         total: int = 0
         for site_inventory in site.siteinventory_set.all():
-            total += site_inventory.reservation_set.count()
+            total += site_inventory.reservation_set.count() + site_inventory.archivedreservation_set.count()
         return total
 
     def allocated(self, site: Site):
@@ -0,0 +1,105 @@
+import datetime
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from checkout.availability import get_reserved_units
+from checkout.models import *
+from checkout.reference_data import get_periods
+
+Allocation = List[Tuple[SiteInventory, int]]
+
+
+class AvailabilityMatrix:
+    """
+    Free units of every item of a technology category on a single day, with one row per item and one column per
+    period, so availability can be compared across items and periods without walking nested dicts.
+    """
+
+    def __init__(self, items: List[SiteInventory], periods: List[Period], free: List[List[int]]):
+        self.items: List[SiteInventory] = items
+        self.periods: List[Period] = periods
+        self.free: List[List[int]] = free
+        self.rows: Dict[int, int] = {item.pk: row for row, item in enumerate(items)}
+        self.columns: Dict[int, int] = {period.pk: column for column, period in enumerate(periods)}
+
+    def item_free(self, item: SiteInventory) -> Dict[Period, int]:
+        """
+        Free units of an item in each period, in period order.
+        """
+        return OrderedDict(zip(self.periods, self.free[self.rows[item.pk]]))
+
+    def free_in(self, periods: List[Period]) -> List[int]:
+        """
+        Units of each item that are free in all of the given periods.
+        """
+        columns = [self.columns[period.pk] for period in periods]
+        return [min(row[column] for column in columns) if columns else 0 for row in self.free]
+
+    def category_free(self, period: Period) -> int:
+        column = self.columns[period.pk]
+        return sum(row[column] for row in self.free)
+
+
+def get_availability_matrix(site: Site, category: TechnologyCategory, request_date: datetime.date) -> \
+        AvailabilityMatrix:
+    items: List[SiteInventory] = list(site.siteinventory_set.filter(inventory__type=category)
+                                      .select_related('inventory__type').order_by('pk'))
+    periods: List[Period] = get_periods()
+    reserved_units = get_reserved_units(items, request_date)
+
+    free = [[max(0, item.units - reserved_units.get((item.pk, request_date, period.pk), 0)) for period in periods]
+            for item in items]
+    return AvailabilityMatrix(items, periods, free)
+
+
+def pick_item(matrix: AvailabilityMatrix, selected_period: Period) -> Optional[SiteInventory]:
+    """
+    Heuristic to pick the 'best' available inventory item. The 'best' item is the one most likely to
+    satisfy the current request (keeping in mind that the requester may want to select several periods
+    after the current one), and the one least likely to go 'out of stock' (i.e. the one with most
+    availability) and prevent other users from reserving it.
+    """
+    selected_column = matrix.columns[selected_period.pk]
+    later_columns = [column for column, period in enumerate(matrix.periods) if period >= selected_period]
+
+    best_item: SiteInventory = None
+    best_avg_availability: float = 0
+    for item, row in zip(matrix.items, matrix.free):
+        item_avg_availability = sum(row[column] for column in later_columns) / len(later_columns)
+        if item_avg_availability > best_avg_availability and row[selected_column] > 0:
+            best_avg_availability = item_avg_availability
+            best_item = item
+
+    return best_item
+
+
+def allocate_units(matrix: AvailabilityMatrix, periods: List[Period], units: int,
+                   preferred_item: SiteInventory = None) -> Optional[Allocation]:
+    """
+    Splits a request for units in the given periods across as few items of the category as possible, returning
+    (item, units) pairs or None if the category doesn't have enough free units. The preferred item is used on its
+    own whenever it has room. Otherwise the fewest items are the largest ones: all but the last are used up entirely,
+    and the rest goes to the item that fits it most tightly, leaving the larger blocks of free units intact for
+    later requests.
+    """
+    free: List[int] = matrix.free_in(periods)
+    if preferred_item is not None and preferred_item.pk in matrix.rows and \
+            free[matrix.rows[preferred_item.pk]] >= units:
+        return [(preferred_item, units)]
+
+    rows: List[int] = sorted((row for row in range(len(matrix.items)) if free[row] > 0), key=lambda row: -free[row])
+    if sum(free[row] for row in rows) < units:
+        return None
+
+    # The fewest items that can hold the request are the largest ones
+    taken: List[int] = []
+    taken_units: int = 0
+    while taken_units + free[rows[len(taken)]] < units:
+        taken.append(rows[len(taken)])
+        taken_units += free[taken[-1]]
+
+    remaining: int = units - taken_units
+    best_fit: int = min((row for row in rows[len(taken):] if free[row] >= remaining), key=lambda row: free[row])
+
+    return [(matrix.items[row], free[row]) for row in taken] + [(matrix.items[best_fit], remaining)]
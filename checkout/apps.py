@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class CheckoutConfig(AppConfig):
     name = 'checkout'
+
+    def ready(self):
+        import checkout.signals  # noqa: F401
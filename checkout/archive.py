@@ -0,0 +1,45 @@
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from checkout.models import Reservation, ArchivedReservation, ReservedUnits
+
+RESERVATION_ARCHIVE_AFTER_DAYS = getattr(settings, 'RESERVATION_ARCHIVE_AFTER_DAYS', 365)
+
+ARCHIVED_FIELDS = [field.attname for field in Reservation._meta.concrete_fields]
+
+
+def get_archive_cutoff() -> date:
+    """
+    Reservations dated before this day are archived.
+    """
+    return datetime.now().date() - timedelta(days=RESERVATION_ARCHIVE_AFTER_DAYS)
+
+
+def archive_batch(cutoff: date, batch_size: int) -> int:
+    """
+    Moves up to batch_size reservations dated before the cutoff, lowest ids first, into the archive and returns how
+    many were moved. Each batch is its own transaction, so an interrupted run loses nothing and the next one carries
+    on where it stopped. The originals are deleted like any other reservation, so the signals take their units out
+    of the ledger, drop their movement plans and bump their sites' data versions as part of the batch.
+    """
+    with transaction.atomic():
+        rows = list(Reservation.objects.select_for_update().filter(date__lt=cutoff).order_by('pk')
+                    .values(*ARCHIVED_FIELDS)[:batch_size])
+        if len(rows) == 0:
+            return 0
+
+        ArchivedReservation.objects.bulk_create([ArchivedReservation(**row) for row in rows])
+        Reservation.objects.filter(pk__in=[row['id'] for row in rows]).delete()
+
+    return len(rows)
+
+
+def drop_archived_ledger(cutoff: date) -> int:
+    """
+    Deletes the reserved units ledger entries before the cutoff that archiving has emptied. Returns the number of
+    entries deleted.
+    """
+    deleted, _ = ReservedUnits.objects.filter(date__lt=cutoff, units=0).delete()
+    return deleted
@@ -0,0 +1,183 @@
+import datetime
+
+from typing import Dict, Iterable, Tuple
+
+from django.db import transaction, DatabaseError, IntegrityError
+from django.db.models import F, Sum
+
+from checkout.models import *
+
+LedgerKey = Tuple[int, datetime.date, int]
+
+
+def add_reserved_units(site_inventory_id: int, reservation_date: datetime.date, period_id: int, units: int):
+    ledger_entry, _ = ReservedUnits.objects.get_or_create(
+        site_inventory_id=site_inventory_id, date=reservation_date, period_id=period_id)
+    ReservedUnits.objects.filter(pk=ledger_entry.pk).update(units=F('units') + units)
+
+
+def remove_reserved_units(site_inventory_id: int, reservation_date: datetime.date, period_id: int, units: int):
+    # Never creates entries, the item or period may be in the middle of a cascading delete
+    ReservedUnits.objects.filter(site_inventory_id=site_inventory_id, date=reservation_date, period_id=period_id) \
+        .update(units=F('units') - units)
+
+
+Slot = Tuple[datetime.date, Period]
+
+
+class InsufficientUnits(Exception):
+    def __init__(self, period: Period, free_units: int, reservation_date: datetime.date = None):
+        super(InsufficientUnits, self).__init__("Only {} units are available in {}".format(free_units, period))
+        self.period: Period = period
+        self.free_units: int = free_units
+        self.date: datetime.date = reservation_date
+
+
+def lock_ledger_entries(site_inventory: SiteInventory, slots: List[Slot]) -> \
+        Dict[Tuple[datetime.date, int], ReservedUnits]:
+    """
+    Loads the item's ledger entries for every (date, period) slot, creating any that are missing, and locks them for
+    the rest of the transaction. All the entries are read by one SELECT ... FOR UPDATE, and missing ones are inserted
+    together. Entries are always locked and inserted in (date, period id) order, so two bookings that share some of
+    their slots wait for each other instead of deadlocking.
+    """
+    dates = {slot_date for slot_date, _ in slots}
+    period_pks = {period.pk for _, period in slots}
+
+    def load():
+        ledger_entries = ReservedUnits.objects.select_for_update() \
+            .filter(site_inventory=site_inventory, date__in=dates, period_id__in=period_pks) \
+            .order_by('date', 'period_id')
+        return {(entry.date, entry.period_id): entry for entry in ledger_entries}
+
+    entries = load()
+    missing = [ReservedUnits(site_inventory=site_inventory, date=slot_date, period=period)
+               for slot_date, period in sorted(slots, key=lambda slot: (slot[0], slot[1].pk))
+               if (slot_date, period.pk) not in entries]
+    if missing:
+        try:
+            with transaction.atomic():
+                ReservedUnits.objects.bulk_create(missing)
+        except IntegrityError:
+            # Another booking created some of them first
+            for entry in missing:
+                ReservedUnits.objects.get_or_create(
+                    site_inventory=site_inventory, date=entry.date, period_id=entry.period_id)
+        entries = load()
+
+    return entries
+
+
+def find_shortfalls(site_inventory: SiteInventory, entries: Dict[Tuple[datetime.date, int], ReservedUnits],
+                    slots: List[Slot], units: int) -> List[InsufficientUnits]:
+    shortfalls: List[InsufficientUnits] = []
+    for slot_date, period in slots:
+        reserved = entries[(slot_date, period.pk)].units
+        if reserved + units > site_inventory.units:
+            shortfalls.append(InsufficientUnits(period, max(0, site_inventory.units - reserved), slot_date))
+
+    return shortfalls
+
+
+def claim_entries(site_inventory: SiteInventory, entries: List[ReservedUnits], units: int):
+    if len(entries) == 0:
+        return
+
+    claimed = ReservedUnits.objects \
+        .filter(pk__in=[entry.pk for entry in entries], units__lte=site_inventory.units - units) \
+        .update(units=F('units') + units)
+
+    # Only possible if the database ignored the row locks taken by lock_ledger_entries
+    if claimed != len(entries):
+        raise DatabaseError("Ledger for {} changed while claiming units".format(site_inventory))
+
+
+def claim_slots(site_inventory: SiteInventory, slots: List[Slot], units: int):
+    """
+    Claims units in every (date, period) slot, raising InsufficientUnits for the first slot without room. All the
+    slots are checked against one locked read of the ledger and claimed with a single conditional UPDATE. Must be
+    called in a transaction that is rolled back on failure. Reservations created for claimed units must be bulk
+    created, so the ledger isn't updated for them a second time.
+    """
+    if len(slots) == 0:
+        return
+
+    entries = lock_ledger_entries(site_inventory, slots)
+    shortfalls: List[InsufficientUnits] = find_shortfalls(site_inventory, entries, slots, units)
+    if len(shortfalls) > 0:
+        raise shortfalls[0]
+
+    claim_entries(site_inventory, [entries[(slot_date, period.pk)] for slot_date, period in slots], units)
+
+
+def claim_available_slots(site_inventory: SiteInventory, slots: List[Slot], units: int) -> List[InsufficientUnits]:
+    """
+    Like claim_slots, but claims units in every slot that has room for them and returns the slots that don't instead
+    of failing on the first one.
+    """
+    if len(slots) == 0:
+        return []
+
+    entries = lock_ledger_entries(site_inventory, slots)
+    shortfalls: List[InsufficientUnits] = find_shortfalls(site_inventory, entries, slots, units)
+    short_slots = {(shortfall.date, shortfall.period.pk) for shortfall in shortfalls}
+
+    claim_entries(site_inventory, [entries[(slot_date, period.pk)] for slot_date, period in slots
+                                   if (slot_date, period.pk) not in short_slots], units)
+    return shortfalls
+
+
+def get_reserved_units(site_inventory_list: Iterable[SiteInventory], reservation_date: datetime.date) -> \
+        Dict[LedgerKey, int]:
+    """
+    Returns the units reserved for the given items on a day, keyed by (site inventory id, date, period id). Entries
+    with nothing reserved may be missing.
+    """
+    ledger_entries = ReservedUnits.objects \
+        .filter(site_inventory__in=list(site_inventory_list), date=reservation_date) \
+        .values_list('site_inventory_id', 'date', 'period_id', 'units')
+
+    return {(site_inventory_id, entry_date, period_id): units
+            for site_inventory_id, entry_date, period_id, units in ledger_entries}
+
+
+def compute_reserved_units() -> Dict[LedgerKey, int]:
+    """
+    Computes what the ledger should contain from the reservations themselves.
+    """
+    totals = Reservation.objects \
+        .values_list('site_inventory_id', 'date', 'period_id') \
+        .annotate(total_units=Sum('units')) \
+        .order_by()
+
+    return {(site_inventory_id, entry_date, period_id): total_units
+            for site_inventory_id, entry_date, period_id, total_units in totals}
+
+
+def find_ledger_drift() -> Dict[LedgerKey, Tuple[int, int]]:
+    """
+    Returns every ledger entry that disagrees with the reservations, as (ledger units, actual units).
+    """
+    expected: Dict[LedgerKey, int] = compute_reserved_units()
+    recorded: Dict[LedgerKey, int] = {
+        (site_inventory_id, entry_date, period_id): units for site_inventory_id, entry_date, period_id, units in
+        ReservedUnits.objects.values_list('site_inventory_id', 'date', 'period_id', 'units')}
+
+    drift: Dict[LedgerKey, Tuple[int, int]] = {}
+    for key in set(expected.keys()) | set(recorded.keys()):
+        if recorded.get(key, 0) != expected.get(key, 0):
+            drift[key] = (recorded.get(key, 0), expected.get(key, 0))
+
+    return drift
+
+
+def rebuild_ledger() -> int:
+    """
+    Replaces the whole ledger with totals computed from the reservations. Should be run inside a transaction.
+    """
+    ReservedUnits.objects.all().delete()
+    ledger_entries = [ReservedUnits(site_inventory_id=site_inventory_id, date=entry_date, period_id=period_id,
+                                    units=units)
+                      for (site_inventory_id, entry_date, period_id), units in compute_reserved_units().items()]
+    ReservedUnits.objects.bulk_create(ledger_entries, batch_size=1000)
+    return len(ledger_entries)
@@ -0,0 +1,113 @@
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.template import loader
+
+from checkout.models import *
+from checkout.movement_schedule import MovementSchedule, get_movement_schedules
+
+# Processes the district_movements command plans sites with by default
+DISTRICT_REPORT_WORKERS = getattr(settings, 'DISTRICT_REPORT_WORKERS', os.cpu_count() or 1)
+
+DISTRICT_REPORT_HEADER = ['Site', 'Date', 'Period', 'Item', 'Units', 'From', 'To', 'Comment']
+
+# One movement: site name, date, period name, item name, units, origin name, destination name and comment. Plain
+# values, so they travel cheaply between processes.
+MovementRow = Tuple[str, str, str, str, int, str, str, str]
+
+
+def get_site_movement_rows(site_pk: str, start_date: date, end_date: date,
+                           use_stored_plans: bool = True) -> List[MovementRow]:
+    """
+    Returns the movements of every working day of a site between the two dates (inclusive), in day and period order.
+    """
+    site: Site = Site.objects.get(pk=site_pk)
+    days: List[date] = sorted(set(WeekDay.objects.filter(site=site, date__range=(start_date, end_date))
+                              .values_list('date', flat=True)))
+    if len(days) == 0:
+        return []
+
+    rows: List[MovementRow] = []
+    schedules: List[MovementSchedule] = get_movement_schedules(site, days, use_stored_plans=use_stored_plans)
+    for schedule in schedules:
+        for period_movements in schedule.periods:
+            for movement in period_movements.movements:
+                rows.append((site.name, schedule.date.isoformat(), period_movements.period.name,
+                             movement.site_inventory.inventory.display_name, movement.units, movement.origin.name,
+                             movement.destination.name, movement.comment or ''))
+
+    return rows
+
+
+def init_worker():
+    # Only needed where workers are spawned rather than forked, setup() does nothing once the apps are loaded
+    django.setup()
+
+
+def get_district_movement_rows(start_date: date, end_date: date,
+                               use_stored_plans: bool = True) -> Iterator[List[MovementRow]]:
+    """
+    Yields the movement rows of every site, one list per site in site name order, planning one site at a time in
+    this process.
+    """
+    for site_pk in Site.objects.order_by('name').values_list('pk', flat=True):
+        yield get_site_movement_rows(site_pk, start_date, end_date, use_stored_plans)
+
+
+def get_district_movement_rows_parallel(start_date: date, end_date: date, workers: int = None,
+                                        use_stored_plans: bool = True) -> Iterator[List[MovementRow]]:
+    """
+    Same as get_district_movement_rows, but with more than one worker the sites are planned in parallel by a pool of
+    processes. Closes this process' database connections before starting the pool, so it is only meant for the
+    district_movements command and never for a request.
+    """
+    site_pks: List[str] = list(Site.objects.order_by('name').values_list('pk', flat=True))
+    workers = min(workers or DISTRICT_REPORT_WORKERS, len(site_pks))
+    if workers <= 1:
+        yield from get_district_movement_rows(start_date, end_date, use_stored_plans)
+        return
+
+    # Forked workers must not share this process' database connections
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        yield from executor.map(get_site_movement_rows, site_pks, [start_date] * len(site_pks),
+                                [end_date] * len(site_pks), [use_stored_plans] * len(site_pks))
+
+
+class Echo:
+    """
+    File-like object that returns what is written to it, so csv.writer can produce lines for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def district_report_csv(site_rows: Iterator[List[MovementRow]]) -> Iterator[str]:
+    writer = csv.writer(Echo())
+    yield writer.writerow(DISTRICT_REPORT_HEADER)
+    for rows in site_rows:
+        yield ''.join(writer.writerow(row) for row in rows)
+
+
+def district_report_html(site_rows: Iterator[List[MovementRow]], context: dict, request=None) -> Iterator[str]:
+    """
+    Streams the printable report: the page up to the site sections, one section per site as it is ready, then the
+    rest of the page.
+    """
+    marker = '<!-- sites -->'
+    page: str = loader.render_to_string('checkout/district_movements.html', dict(context, sites_marker=marker),
+                                        request)
+    head, tail = page.split(marker, 1)
+
+    yield head
+    for rows in site_rows:
+        if len(rows) > 0:
+            yield loader.render_to_string('checkout/district_movements_site.html',
+                                          {'site_name': rows[0][0], 'rows': rows})
+    yield tail
@@ -0,0 +1,194 @@
+import csv
+import io
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.core import signing
+from django.db.models import Count, Q, QuerySet
+
+from checkout.models import *
+
+EXPORT_HEADER = ['Site', 'User', 'Teaching Team', 'Subject', 'Classroom', 'Date', 'Week', 'Period', 'Units', 'Type',
+                 'SKU', 'Purpose', 'Collaborative', 'Total Teams at Site', 'ID', 'Created', 'Modified']
+
+# Flushed to the response whenever this much CSV has been buffered
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FIELDS = [
+    'site_inventory__site_id', 'site_inventory__site__name', 'creator__name', 'creator__email', 'team_id',
+    'team__subject__name', 'classroom__name', 'date', 'period__number', 'units', 'site_inventory__inventory__type__name',
+    'site_inventory__inventory__display_name', 'purpose__purpose', 'collaborative', 'pk', 'created', 'modified']
+
+# Query parameters an export can be filtered by: site (name), start and end (reservation dates, inclusive), category
+# (id) and modified_since (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)
+EXPORT_FILTERS = ['site', 'start', 'end', 'category', 'modified_since']
+
+EXPORT_MAX_PAGE_SIZE = 50000
+
+# Where a paged export has got to: the index of the queryset, and the modification time and id of the last
+# reservation exported from it
+ExportPosition = Tuple[int, datetime, int]
+
+
+def get_export_filters(params) -> Dict[str, str]:
+    return {name: params[name] for name in EXPORT_FILTERS if params.get(name)}
+
+
+def get_export_querysets(filters: Dict[str, str] = None) -> List[QuerySet]:
+    """
+    The reservations to export, current ones first and then the archived ones. Raises ValueError for a malformed
+    filter.
+    """
+    filters = filters or {}
+    matching = Q()
+    if 'site' in filters:
+        matching &= Q(site_inventory__site_id=filters['site'])
+    if 'start' in filters:
+        matching &= Q(date__gte=datetime.strptime(filters['start'], '%Y-%m-%d').date())
+    if 'end' in filters:
+        matching &= Q(date__lte=datetime.strptime(filters['end'], '%Y-%m-%d').date())
+    if 'category' in filters:
+        matching &= Q(site_inventory__inventory__type_id=int(filters['category']))
+    if 'modified_since' in filters:
+        modified_since: datetime = datetime.fromisoformat(filters['modified_since'])
+        if modified_since.tzinfo is not None:
+            raise ValueError("modified_since must be a local time")
+        matching &= Q(modified__gte=modified_since)
+
+    return [Reservation.objects.filter(matching), ArchivedReservation.objects.filter(matching)]
+
+
+def after_position(position: ExportPosition) -> Q:
+    _, modified, pk = position
+    return Q(modified__gt=modified) | Q(modified=modified, pk__gt=pk)
+
+
+def up_to_position(position: ExportPosition) -> Q:
+    _, modified, pk = position
+    return Q(modified__lt=modified) | Q(modified=modified, pk__lte=pk)
+
+
+def get_export_page(querysets: List[QuerySet], position: Optional[ExportPosition],
+                    page_size: int) -> Tuple[List[QuerySet], Optional[ExportPosition]]:
+    """
+    Narrows the querysets to the page_size reservations after the position (from the start if None), in order of
+    modification, and returns them with the position the next page starts from (None if this is the last page). Only
+    the modification times and ids of the page are read here, from the (modified, id) index; the rows themselves are
+    read as they are exported.
+
+    A reservation modified while an export is being paged through moves to the end of its table, so it may come up
+    twice, or not at all if the export has moved on to the archive - an incremental export from modified_since no
+    later than when the first page was fetched picks it up.
+    """
+    page: List[QuerySet] = []
+    remaining = page_size
+    last_position: Optional[ExportPosition] = None
+    for index, queryset in enumerate(querysets):
+        if position is not None and index < position[0]:
+            continue
+        if position is not None and index == position[0]:
+            queryset = queryset.filter(after_position(position))
+        queryset = queryset.order_by('modified', 'pk')
+
+        if remaining == 0:
+            if queryset.exists():
+                return page, last_position
+            continue
+
+        keys: List[Tuple[datetime, int]] = list(queryset.values_list('modified', 'pk')[:remaining + 1])
+        if len(keys) > remaining:
+            last_position = (index,) + keys[remaining - 1]
+            page.append(queryset.filter(up_to_position(last_position)))
+            return page, last_position
+
+        if len(keys) > 0:
+            page.append(queryset)
+            last_position = (index,) + keys[-1]
+            remaining -= len(keys)
+
+    return page, None
+
+
+def dump_export_cursor(filters: Dict[str, str], page_size: int, position: ExportPosition) -> str:
+    """
+    Returns an opaque cursor for the page after the position. It carries the filters and page size too, and is
+    signed, so it can't be used to page through anything other than the export it came from.
+    """
+    index, modified, pk = position
+    return signing.dumps({'filters': filters, 'page_size': page_size, 'position': [index, modified.isoformat(), pk]},
+                         salt='checkout.export', compress=True)
+
+
+def load_export_cursor(cursor: str) -> Tuple[Dict[str, str], int, ExportPosition]:
+    """
+    Returns the filters, page size and position of a cursor from dump_export_cursor. Raises ValueError if it isn't
+    one.
+    """
+    try:
+        state = signing.loads(cursor, salt='checkout.export')
+    except signing.BadSignature:
+        raise ValueError("Invalid export cursor")
+
+    index, modified, pk = state['position']
+    return state['filters'], state['page_size'], (index, datetime.fromisoformat(modified), pk)
+
+
+def export_rows(querysets: Iterable[QuerySet]) -> Iterator[List[Any]]:
+    """
+    Yields one export row per reservation. Everything a row needs from other tables is joined in the reservations
+    query, which is read through a server-side cursor where the database has them (iterator()), except for team
+    members, team counts and week numbers which are loaded once up front, so only the row being written is held in
+    memory. Querysets that aren't ordered are exported in id order.
+    """
+    team_members: Dict[int, List[str]] = defaultdict(list)
+    for team_pk, member_name in Team.members.through.objects.order_by('team_id', 'user_id') \
+            .values_list('team_id', 'user__name'):
+        team_members[team_pk].append(member_name)
+
+    site_teams: Dict[str, int] = dict(Team.objects.values_list('site_id').annotate(count=Count('pk')).order_by())
+    site_weeks: Dict[Tuple[str, date], int] = {
+        (site_pk, week_date): week_number for site_pk, week_date, week_number in
+        WeekDay.objects.values_list('site_id', 'date', 'week__week_number')}
+
+    for queryset in querysets:
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        for site_pk, site_name, creator_name, creator_email, team_pk, subject, classroom, reservation_date, \
+                period_number, units, category, display_name, purpose, collaborative, reservation_pk, created, \
+                modified in queryset.values_list(*EXPORT_FIELDS).iterator():
+            yield [
+                site_name,
+                creator_name + " (" + creator_email + ")",
+                ", ".join(team_members[team_pk]),
+                subject,
+                classroom,
+                reservation_date,
+                site_weeks.get((site_pk, reservation_date), 0),
+                period_number,
+                units,
+                category,
+                display_name,
+                purpose if purpose is not None else UsagePurpose.OTHER_PURPOSE,
+                1 if collaborative else 0,
+                site_teams.get(site_pk, 0),
+                reservation_pk,
+                created.isoformat(),
+                modified.isoformat(),
+            ]
+
+
+def export_csv(rows: Iterable[List[Any]]) -> Iterator[str]:
+    """
+    Writes the header and rows as CSV, yielding it in chunks of about EXPORT_CHUNK_SIZE characters.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
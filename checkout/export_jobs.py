@@ -0,0 +1,121 @@
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from openpyxl import Workbook
+
+from checkout.export import EXPORT_HEADER, get_export_querysets, export_rows, export_csv
+from checkout.models import *
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROOT = getattr(settings, 'EXPORT_ROOT', os.path.join(settings.BASE_DIR, 'exports'))
+
+# A running job saves how far it has got every this many rows
+EXPORT_JOB_PROGRESS_ROWS = 5000
+
+# Rows in an Excel worksheet, including the header
+XLSX_MAX_ROWS = 1048576
+
+
+def enqueue_export_job(user: User, filters: Dict[str, str], export_format: str) -> ExportJob:
+    """
+    Queues an export of the reservations matching the filters. Raises ValueError for a malformed filter or an unknown
+    format, so that mistakes are reported when the job is requested rather than when it runs.
+    """
+    get_export_querysets(filters)
+    if export_format not in dict(ExportJob.FORMATS):
+        raise ValueError("Unknown export format '{}'".format(export_format))
+
+    return ExportJob.objects.create(requested_by=user, filters=json.dumps(filters), format=export_format)
+
+
+def claim_export_job() -> Optional[ExportJob]:
+    """
+    Marks the oldest queued job as running and returns it, or returns None if nothing is queued. A job only moves
+    from queued to running once, so any number of workers can take jobs from the same queue.
+    """
+    while True:
+        job: Optional[ExportJob] = ExportJob.objects.filter(status=ExportJob.QUEUED).order_by('created', 'pk').first()
+        if job is None:
+            return None
+
+        if ExportJob.objects.filter(pk=job.pk, status=ExportJob.QUEUED) \
+                .update(status=ExportJob.RUNNING, started=datetime.now()) == 1:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_stale_export_jobs(started_before: datetime) -> int:
+    """
+    Queues again the jobs that started running before the given time and never finished, because the worker running
+    them was stopped. Returns the number of jobs queued.
+    """
+    return ExportJob.objects.filter(status=ExportJob.RUNNING, started__lt=started_before) \
+        .update(status=ExportJob.QUEUED, started=None, rows_written=0)
+
+
+def get_export_path(job: ExportJob) -> str:
+    return os.path.join(EXPORT_ROOT, job.file_name)
+
+
+def track_progress(job: ExportJob, rows: Iterable[List[Any]]) -> Iterator[List[Any]]:
+    written = 0
+    for row in rows:
+        yield row
+        written += 1
+        if written % EXPORT_JOB_PROGRESS_ROWS == 0:
+            ExportJob.objects.filter(pk=job.pk).update(rows_written=written)
+
+    ExportJob.objects.filter(pk=job.pk).update(rows_written=written)
+
+
+def write_csv(rows: Iterable[List[Any]], path: str):
+    with open(path, 'w', newline='') as export_file:
+        for chunk in export_csv(rows):
+            export_file.write(chunk)
+
+
+def write_xlsx(rows: Iterable[List[Any]], path: str):
+    # Write-only workbooks stream rows to the file instead of keeping every cell in memory
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet('Reservations')
+    worksheet.append(EXPORT_HEADER)
+    for row in rows:
+        worksheet.append(row)
+    workbook.save(path)
+
+
+def run_export_job(job: ExportJob):
+    """
+    Writes the job's export to EXPORT_ROOT, saving its progress as it goes. The file only appears under its final
+    name once it is complete. A job that fails is marked as such with the error, and leaves no file behind.
+    """
+    file_name = 'reservations-{}-{}.{}'.format(job.pk, job.created.strftime('%Y%m%d-%H%M%S'), job.format)
+    partial_path = os.path.join(EXPORT_ROOT, file_name + '.partial')
+    try:
+        querysets = get_export_querysets(job.get_filters())
+        rows_total = sum(queryset.count() for queryset in querysets)
+        ExportJob.objects.filter(pk=job.pk).update(rows_total=rows_total)
+        if job.format == ExportJob.XLSX and rows_total >= XLSX_MAX_ROWS:
+            raise ValueError("{} reservations don't fit in an Excel worksheet, please export them as CSV "
+                             "instead".format(rows_total))
+
+        os.makedirs(EXPORT_ROOT, exist_ok=True)
+        rows = track_progress(job, export_rows(querysets))
+        if job.format == ExportJob.XLSX:
+            write_xlsx(rows, partial_path)
+        else:
+            write_csv(rows, partial_path)
+        os.replace(partial_path, os.path.join(EXPORT_ROOT, file_name))
+    except Exception as e:
+        logger.exception("Export job %s failed", job.pk)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.FAILED, error=str(e) or type(e).__name__,
+                                                   finished=datetime.now())
+        return
+
+    ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.DONE, file_name=file_name, finished=datetime.now())
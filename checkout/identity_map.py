@@ -0,0 +1,59 @@
+from typing import Any, Dict, Iterable, Tuple
+
+from django.db import models
+
+from checkout.models import *
+from checkout.reference_data import get_periods
+
+
+class IdentityMap:
+    """
+    Keeps one instance of every object loaded while handling a request, keyed by model and primary key, so that
+    reservations pointing at the same item, classroom or period share it rather than each loading a copy. Starts out
+    with the cached periods.
+    """
+
+    def __init__(self):
+        self.instances: Dict[Tuple[type, Any], models.Model] = {}
+        self.add_all(get_periods())
+
+    def get(self, model: type, pk) -> models.Model:
+        return self.instances.get((model, pk))
+
+    def add(self, instance: models.Model) -> models.Model:
+        """
+        Returns the instance already in the map for the same object if there is one, otherwise adds this one.
+        """
+        return self.instances.setdefault((instance._meta.concrete_model, instance.pk), instance)
+
+    def add_all(self, instances: Iterable[models.Model]) -> List[models.Model]:
+        return [self.add(instance) for instance in instances]
+
+    def attach(self, objects: List[models.Model], field_name: str, queryset: models.QuerySet = None) -> \
+            List[models.Model]:
+        """
+        Points a foreign key of every object at the shared instance of the related object, loading the related objects
+        that aren't in the map yet with a single query (from queryset, if given, to follow further relations).
+        """
+        if len(objects) == 0:
+            return objects
+
+        field = objects[0]._meta.get_field(field_name)
+        model = field.related_model
+        pks = {getattr(obj, field.attname) for obj in objects} - {None}
+        missing = [pk for pk in pks if (model, pk) not in self.instances]
+        if len(missing) > 0:
+            self.add_all((queryset if queryset is not None else model.objects.all()).filter(pk__in=missing))
+
+        for obj in objects:
+            pk = getattr(obj, field.attname)
+            if pk is not None:
+                setattr(obj, field_name, self.get(model, pk))
+
+        return objects
+
+
+def get_identity_map(request) -> IdentityMap:
+    if not hasattr(request, '_identity_map'):
+        request._identity_map = IdentityMap()
+    return request._identity_map
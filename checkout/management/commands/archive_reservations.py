@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from checkout.archive import get_archive_cutoff, archive_batch, drop_archived_ledger
+
+
+class Command(BaseCommand):
+    help = 'Moves reservations older than RESERVATION_ARCHIVE_AFTER_DAYS into the archive, in batches. Safe to stop ' \
+           'at any time - running it again carries on where it stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive reservations dated before this day (YYYY-MM-DD) instead')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reservations moved per transaction')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+
+    def handle(self, *args, **options):
+        cutoff = get_archive_cutoff()
+        if options['before']:
+            try:
+                cutoff = datetime.strptime(options['before'], '%Y-%m-%d').date()
+            except ValueError:
+                self.stderr.write("Invalid date '{}', expected YYYY-MM-DD".format(options['before']))
+                exit(1)
+
+        if cutoff > datetime.now().date():
+            self.stderr.write("Only past reservations can be archived")
+            exit(1)
+
+        total: int = 0
+        batches: int = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = archive_batch(cutoff, options['batch_size'])
+            if moved == 0:
+                break
+
+            total += moved
+            batches += 1
+            self.stdout.write('Archived {} reservations dated before {}'.format(total, cutoff))
+
+        dropped = drop_archived_ledger(cutoff)
+        self.stdout.write('✔ Archived {} reservations, removed {} ledger entries'.format(total, dropped))
@@ -0,0 +1,86 @@
+import random
+import time
+from typing import Dict, List, Tuple
+
+from django.core.management.base import BaseCommand
+
+from checkout.allocation import AvailabilityMatrix, Allocation, pick_item, allocate_units
+from checkout.models import SiteInventory, Period
+
+
+class Command(BaseCommand):
+    help = 'Fills synthetic days with random booking requests and compares single item bookings (pick_item) with ' \
+           'split bookings (allocate_units) - how many requests each satisfies, how many items split bookings use ' \
+           'and how long each takes. Runs in memory, no database access.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='5x8,20x8,100x10,500x12',
+                            help='Comma separated list of ITEMSxPERIODS matrix sizes')
+        parser.add_argument('--days', type=int, default=20, help='Days simulated for each size')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for size in options['sizes'].split(','):
+            item_count, period_count = [int(dimension) for dimension in size.split('x')]
+            rng = random.Random(options['seed'])
+            periods = [Period(pk=number, number=number, name='Period {}'.format(number))
+                       for number in range(1, period_count + 1)]
+            items = [SiteInventory(pk=pk, units=rng.choice([10, 15, 20, 30, 36])) for pk in range(1, item_count + 1)]
+            capacity = sum(item.units for item in items)
+            requests = [make_requests(rng, periods, capacity) for _ in range(options['days'])]
+
+            for name, book in [('single item', book_single_item), ('split', book_split)]:
+                results: Dict[str, float] = {'requests': 0, 'booked': 0, 'items_used': 0, 'seconds': 0.0}
+                for day_requests in requests:
+                    matrix = AvailabilityMatrix(items, periods, [[item.units] * period_count for item in items])
+                    for request_periods, units in day_requests:
+                        start_time = time.perf_counter()
+                        allocation = book(matrix, request_periods, units)
+                        results['seconds'] += time.perf_counter() - start_time
+                        results['requests'] += 1
+                        if allocation is not None:
+                            apply_allocation(matrix, request_periods, allocation)
+                            results['booked'] += 1
+                            results['items_used'] += len(allocation)
+
+                self.stdout.write('{} items x {} periods, {}: {} of {} requests booked ({:.1f}%), {:.2f} items per '
+                                  'booking, {:.1f}us per request'.format(
+                                      item_count, period_count, name, results['booked'], results['requests'],
+                                      100.0 * results['booked'] / results['requests'],
+                                      results['items_used'] / max(1, results['booked']),
+                                      1e6 * results['seconds'] / results['requests']))
+
+
+def make_requests(rng: random.Random, periods: List[Period], capacity: int) -> List[Tuple[List[Period], int]]:
+    """
+    Random requests for one day, asking for roughly twice the capacity in every period.
+    """
+    day_requests = []
+    requested = 0
+    while requested < 2 * capacity * len(periods):
+        first = rng.randrange(len(periods))
+        request_periods = periods[first:first + rng.choice([1, 1, 2, 3])]
+        units = rng.choice([5, 10, 15, 20, 25, 30, 35, 40])
+        day_requests.append((request_periods, units))
+        requested += units * len(request_periods)
+
+    return day_requests
+
+
+def book_single_item(matrix: AvailabilityMatrix, periods: List[Period], units: int) -> Allocation:
+    item = pick_item(matrix, periods[0])
+    if item is None or matrix.free_in(periods)[matrix.rows[item.pk]] < units:
+        return None
+
+    return [(item, units)]
+
+
+def book_split(matrix: AvailabilityMatrix, periods: List[Period], units: int) -> Allocation:
+    return allocate_units(matrix, periods, units)
+
+
+def apply_allocation(matrix: AvailabilityMatrix, periods: List[Period], allocation: Allocation):
+    for item, units in allocation:
+        row = matrix.free[matrix.rows[item.pk]]
+        for period in periods:
+            row[matrix.columns[period.pk]] -= units
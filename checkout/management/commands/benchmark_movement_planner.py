@@ -0,0 +1,129 @@
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from django.core.management.base import BaseCommand
+
+from checkout.models import Site, SiteInventory, Classroom, Period, Reservation
+from checkout.movement_schedule import MOVEMENT_PLANNERS, Movement, bucket_item_reservations, get_movement_periods
+from checkout.reservation_schedule import get_site_inventory, get_reservations
+
+# Each case is (items, storage location, periods, reservations of each item in each period)
+Case = Tuple[List[SiteInventory], Classroom, List[Period], Dict[int, List[List[Reservation]]]]
+
+
+class Command(BaseCommand):
+    help = 'Compares the movement planners - how many moves and units moved each plans, and how long each takes - ' \
+           'on synthetic days and on the configured weeks of a site. Also checks that every plan serves the same ' \
+           'units the reservations ask for.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=50, help='Synthetic days')
+        parser.add_argument('--items', type=int, default=4, help='Items at the synthetic site')
+        parser.add_argument('--classrooms', type=int, default=12, help='Classrooms at the synthetic site')
+        parser.add_argument('--periods', type=int, default=7, help='Periods in a synthetic day')
+        parser.add_argument('--site', help='Also compare on every configured week of this site (by name)')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        periods = [Period(pk=number, number=number, name='Before Period {}'.format(number))
+                   for number in range(1, options['periods'] + 1)]
+        periods.append(Period(pk=0, number=options['periods'] + 1, name='Cleanup'))
+        classrooms = [Classroom(pk=number, name='Room {}'.format(number))
+                      for number in range(1, options['classrooms'] + 1)]
+        cases = [make_case(rng, periods, classrooms, options['items']) for _ in range(options['days'])]
+        self.compare('Synthetic ({} days)'.format(len(cases)), cases)
+
+        if options['site']:
+            site = Site.objects.filter(name=options['site']).first()
+            if site is None:
+                self.stderr.write("Site '{}' not found".format(options['site']))
+                exit(1)
+
+            items = get_site_inventory(site)
+            periods = get_movement_periods()
+            cases = []
+            for week in site.week_set.order_by('week_number'):
+                days = sorted(week.days())
+                if len(days) == 0:
+                    continue
+                buckets = bucket_item_reservations(
+                    sorted(get_reservations(site, days), key=lambda reservation: reservation.pk))
+                for day in days:
+                    storage_location = Classroom(pk=0, site=site, code="DEF", name='Storage')
+                    cases.append((items, storage_location, periods, {
+                        item.pk: [buckets.get((item.pk, day, period.pk), []) for period in periods]
+                        for item in items}))
+            self.compare('{} ({} days)'.format(site.name, len(cases)), cases)
+
+    def compare(self, title: str, cases: List[Case]):
+        self.stdout.write(title)
+        for name, plan_item in MOVEMENT_PLANNERS.items():
+            moves, units_moved, seconds = 0, 0, 0.0
+            for items, storage_location, periods, item_reservations in cases:
+                for item in items:
+                    movements: Dict[Period, List[Movement]] = {period: [] for period in periods}
+                    start_time = time.perf_counter()
+                    plan_item(item, storage_location, periods, item_reservations[item.pk], movements)
+                    seconds += time.perf_counter() - start_time
+
+                    check_plan(item, storage_location, periods, item_reservations[item.pk], movements)
+                    moves += sum(len(period_movements) for period_movements in movements.values())
+                    units_moved += sum(movement.units for period_movements in movements.values()
+                                       for movement in period_movements)
+
+            self.stdout.write('  {:8} {:6} moves, {:7} units moved, {:.1f}ms'.format(
+                name, moves, units_moved, 1000 * seconds))
+
+
+def make_case(rng: random.Random, periods: List[Period], classrooms: List[Classroom], item_count: int) -> Case:
+    """
+    A synthetic day where most classrooms keep the same item for a few periods in a row, as they do when a class
+    uses laptops for a block or books every period of a project.
+    """
+    storage_location = Classroom(pk=0, name='Storage')
+    items = [SiteInventory(pk=pk, units=rng.choice([20, 30, 36]), storage_location='Storage')
+             for pk in range(1, item_count + 1)]
+    item_reservations = {}
+    for item in items:
+        period_reservations: List[List[Reservation]] = [[] for _ in periods]
+        for index in range(len(periods) - 1):
+            free = item.units - sum(reservation.units for reservation in period_reservations[index])
+            while free > 0 and rng.random() < 0.6:
+                units = min(free, rng.choice([5, 8, 10, 12, 15]))
+                classroom = rng.choice(classrooms)
+                for repeat in range(rng.choice([1, 1, 2, 3])):
+                    if index + repeat >= len(periods) - 1:
+                        break
+                    booked = sum(reservation.units for reservation in period_reservations[index + repeat])
+                    if booked + units <= item.units:
+                        period_reservations[index + repeat].append(Reservation(classroom=classroom, units=units))
+                free -= units
+        item_reservations[item.pk] = period_reservations
+
+    return items, storage_location, periods, item_reservations
+
+
+def check_plan(item: SiteInventory, storage_location: Classroom, periods: List[Period],
+               period_reservations: List[List[Reservation]], movements: Dict[Period, List[Movement]]):
+    """
+    Replays the plan and checks that units are only moved from where they are, that every classroom has the units
+    its reservations ask for and that everything is back in storage at the end of the day.
+    """
+    units_by_location: Dict[Classroom, int] = defaultdict(int, {storage_location: item.units})
+    for period, reservations in zip(periods, period_reservations):
+        for movement in movements[period]:
+            units_by_location[movement.origin] -= movement.units
+            units_by_location[movement.destination] += movement.units
+            assert units_by_location[movement.origin] >= 0, "Moved units that weren't there"
+
+        wanted: Dict[Classroom, int] = defaultdict(int)
+        for reservation in reservations:
+            wanted[reservation.classroom] += reservation.units
+        if sum(wanted.values()) <= item.units:
+            for classroom, units in wanted.items():
+                assert units_by_location[classroom] >= units, "Reservation in {} not served".format(classroom)
+
+    assert units_by_location[storage_location] == item.units, "Units left out of storage"
@@ -0,0 +1,143 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from typing import Callable, List, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import QuerySet
+
+from checkout.models import Site, TechnologyCategory, InventoryItem, SiteInventory, Classroom, Subject, Team, User, \
+    Period, Reservation
+
+BENCHMARK_SITE_NAME = 'Index Benchmark Site'
+
+
+class Command(BaseCommand):
+    help = 'Loads a large synthetic set of reservations and reports the query plan and timing of the hot reservation ' \
+           'queries (schedule, slot lookups, conflict checks, My reservations, admin) without and with the ' \
+           'Reservation indexes. Works on SQLite and PostgreSQL. Everything runs in one transaction that is rolled ' \
+           'back, so the database is left as it was.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservations', type=int, default=200000)
+        parser.add_argument('--items', type=int, default=30, help='Items at the benchmark site')
+        parser.add_argument('--teams', type=int, default=200)
+        parser.add_argument('--days', type=int, default=365, help='Days the reservations are spread over')
+        parser.add_argument('--repeat', type=int, default=20, help='Times each query is timed')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            self.stderr.write("Query plans can only be read on SQLite and PostgreSQL")
+            exit(1)
+
+        periods: List[Period] = sorted(Period.objects.all())
+        if len(periods) == 0:
+            self.stderr.write("No periods found, please run 'python manage.py setup'")
+            exit(1)
+
+        with transaction.atomic():
+            queries = self.create_fixtures(periods, options)
+            self.stdout.write('Loaded {} reservations\n'.format(
+                Reservation.objects.filter(site_inventory__site__name=BENCHMARK_SITE_NAME).count()))
+
+            indexes = Reservation._meta.indexes
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.remove_index(Reservation, index)
+            self.analyze()
+            self.run_queries('Without indexes', queries, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for index in indexes:
+                    editor.add_index(Reservation, index)
+            self.analyze()
+            self.run_queries('With indexes', queries, options['repeat'])
+
+            transaction.set_rollback(True)
+
+    def create_fixtures(self, periods: List[Period], options) -> List[Tuple[str, Callable[[], QuerySet]]]:
+        rng = random.Random(options['seed'])
+        site = Site.objects.create(name=BENCHMARK_SITE_NAME)
+        category, _ = TechnologyCategory.objects.get_or_create(name='Index Benchmark Category')
+        subject, _ = Subject.objects.get_or_create(name=Subject.ACTIVITY_SUBJECT)
+        creator = User.objects.create(email='index-benchmark@{}.invalid'.format(id(site)), name='Index Benchmark',
+                                      site=site)
+
+        items = []
+        for number in range(options['items']):
+            inventory = InventoryItem.objects.create(type=category, model_identifier='Benchmark {}'.format(number),
+                                                     display_name='Benchmark{}'.format(number), units=1000)
+            items.append(SiteInventory.objects.create(site=site, inventory=inventory, units=1000))
+        teams = [Team.objects.create(site=site, subject=subject) for _ in range(options['teams'])]
+        teams[0].members.add(creator)
+        classrooms = [Classroom.objects.create(site=site, name='Benchmark Room {}'.format(number), code=str(number))
+                      for number in range(20)]
+
+        # Every reservation takes a distinct (item, date, period, team) so the unique constraint always holds
+        first_day = date.today() - timedelta(days=options['days'] // 2)
+        slots_per_team = options['items'] * options['days'] * len(periods)
+        reservations = []
+        for number in rng.sample(range(slots_per_team * len(teams)), min(options['reservations'],
+                                                                        slots_per_team * len(teams))):
+            team_index, slot = divmod(number, slots_per_team)
+            item_index, slot = divmod(slot, options['days'] * len(periods))
+            day, period_index = divmod(slot, len(periods))
+            reservations.append(Reservation(
+                team=teams[team_index], site_inventory=items[item_index], classroom=rng.choice(classrooms),
+                date=first_day + timedelta(days=day), period=periods[period_index], units=rng.randint(1, 30),
+                collaborative=False, creator=creator))
+        # SQLite splits each of these into the largest inserts it accepts
+        for start in range(0, len(reservations), 2000):
+            Reservation.objects.bulk_create(reservations[start:start + 2000])
+
+        today = date.today()
+        week = (today - timedelta(days=today.weekday()), today - timedelta(days=today.weekday() - 4))
+        item, team = items[0], teams[0]
+        return [
+            ('Week schedule', lambda: Reservation.objects
+                .filter(site_inventory__site=site, date__range=week).order_by('site_inventory_id', 'pk')),
+            ('Slot (movements)', lambda: Reservation.objects.filter(site_inventory=item, date=today,
+                                                                    period=periods[0])),
+            ('Conflict check', lambda: Reservation.objects
+                .filter(team=team, site_inventory__in=items[:2], classroom=classrooms[0], date__in=[today],
+                        period__in=periods[:2]).values_list('site_inventory_id', 'date', 'period_id')),
+            ('Upcoming reservations', lambda: Reservation.objects
+                .filter(team__members=creator, date__gte=today).order_by('date', 'period__number', 'pk')),
+            ('Past reservations page', lambda: Reservation.objects
+                .filter(team__members=creator, date__lt=today).order_by('-date', '-period__number', '-pk')[:51]),
+            ('Admin month', lambda: Reservation.objects
+                .filter(date__gte=today.replace(day=1), date__lt=today.replace(day=1) + timedelta(days=31))
+                .order_by('-pk')[:100]),
+            ('Units reduced', lambda: Reservation.objects.filter(site_inventory=item, date__gte=today, units__gt=25)),
+        ]
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE {}'.format(connection.ops.quote_name(Reservation._meta.db_table)))
+
+    def run_queries(self, title: str, queries: List[Tuple[str, Callable[[], QuerySet]]], repeat: int):
+        self.stdout.write('{}\n{}'.format(title, '=' * len(title)))
+        for name, make_queryset in queries:
+            sql, params = make_queryset().query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(explain_prefix() + sql, params)
+                plan = [row[-1] for row in cursor.fetchall()]
+
+            timings = []
+            for _ in range(repeat):
+                start_time = time.perf_counter()
+                list(make_queryset())
+                timings.append(time.perf_counter() - start_time)
+
+            self.stdout.write('{}: median {:.2f}ms, best {:.2f}ms'.format(
+                name, 1000 * statistics.median(timings), 1000 * min(timings)))
+            for line in plan:
+                self.stdout.write('    {}'.format(line))
+        self.stdout.write('')
+
+
+def explain_prefix() -> str:
+    return 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
@@ -0,0 +1,60 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from checkout.district_report import DISTRICT_REPORT_WORKERS, get_district_movement_rows_parallel, \
+    district_report_csv, district_report_html
+
+
+class Command(BaseCommand):
+    help = 'Writes the movements of every site between two days (tomorrow by default) as CSV or printable HTML, ' \
+           'planning sites in parallel. With --scaling, plans everything from scratch with each number of workers ' \
+           'and reports the wall-clock time instead.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD), tomorrow by default')
+        parser.add_argument('--end', help='Last day (YYYY-MM-DD), the first day by default')
+        parser.add_argument('--format', choices=['csv', 'html'], default='csv')
+        parser.add_argument('--output', help='File to write to instead of standard output')
+        parser.add_argument('--workers', type=int, default=DISTRICT_REPORT_WORKERS)
+        parser.add_argument('--scaling', help='Comma separated numbers of workers to time, e.g. 1,2,4,8')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] \
+                else datetime.now().date() + timedelta(days=1)
+            end_date = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else start_date
+        except ValueError:
+            self.stderr.write("Dates must be given as YYYY-MM-DD")
+            exit(1)
+
+        if options['scaling']:
+            self.report_scaling(start_date, end_date, [int(workers) for workers in options['scaling'].split(',')])
+            return
+
+        site_rows = get_district_movement_rows_parallel(start_date, end_date, options['workers'])
+        if options['format'] == 'csv':
+            chunks = district_report_csv(site_rows)
+        else:
+            chunks = district_report_html(site_rows, {'start_date': start_date, 'end_date': end_date})
+
+        output = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+
+    def report_scaling(self, start_date, end_date, worker_counts):
+        baseline = None
+        for workers in worker_counts:
+            start_time = time.perf_counter()
+            movements = sum(len(rows) for rows in get_district_movement_rows_parallel(
+                start_date, end_date, workers, use_stored_plans=False))
+            seconds = time.perf_counter() - start_time
+            baseline = baseline or seconds
+            self.stdout.write('{:3} workers: {:.2f}s, {:.2f}x ({} movements)'.format(
+                workers, seconds, baseline / seconds, movements))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from checkout.availability import find_ledger_drift, rebuild_ledger
+
+
+class Command(BaseCommand):
+    help = 'Checks the reserved units ledger against reservations and rebuilds it from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report entries that have drifted from the reservations, do not rebuild')
+
+    def handle(self, *args, **options):
+        drift = find_ledger_drift()
+        for (site_inventory_id, entry_date, period_id), (recorded, expected) in sorted(drift.items()):
+            self.stdout.write('! Site inventory {} on {} in period {}: ledger has {} units, reservations have {}'.format(
+                site_inventory_id, entry_date, period_id, recorded, expected))
+
+        if len(drift) == 0:
+            self.stdout.write('✔ Reserved units ledger matches reservations')
+        else:
+            self.stdout.write('! {} ledger entries have drifted'.format(len(drift)))
+
+        if options['check']:
+            if len(drift) > 0:
+                exit(1)
+            return
+
+        with transaction.atomic():
+            count = rebuild_ledger()
+
+        self.stdout.write('✔ Rebuilt reserved units ledger ({} entries)'.format(count))
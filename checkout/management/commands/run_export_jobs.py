@@ -0,0 +1,43 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from checkout.export_jobs import claim_export_job, requeue_stale_export_jobs, run_export_job
+
+
+class Command(BaseCommand):
+    help = 'Runs the export jobs queued from the export page, writing their files to EXPORT_ROOT, and waits for ' \
+           'more. Several workers can run at once. The files are downloaded through the web server, so workers must ' \
+           'run where it can read EXPORT_ROOT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit once no jobs are queued, e.g. when run by cron')
+        parser.add_argument('--poll', type=float, default=5, help='Seconds between checks for queued jobs')
+        parser.add_argument('--requeue-after', type=int,
+                            help='First queue again the jobs that have been running for more than this many minutes, '
+                                 'left behind by a worker that was stopped')
+
+    def handle(self, *args, **options):
+        if options['requeue_after'] is not None:
+            requeued = requeue_stale_export_jobs(datetime.now() - timedelta(minutes=options['requeue_after']))
+            self.stdout.write('Queued {} stale jobs again'.format(requeued))
+
+        while True:
+            job = claim_export_job()
+            if job is None:
+                if options['once']:
+                    break
+                # Don't hold on to a connection the database may have closed while waiting
+                close_old_connections()
+                time.sleep(options['poll'])
+                continue
+
+            self.stdout.write('Running export job {} ({})'.format(job.pk, job.get_format_display()))
+            run_export_job(job)
+            job.refresh_from_db()
+            if job.status == job.DONE:
+                self.stdout.write('✔ Wrote {} reservations to {}'.format(job.rows_written, job.file_name))
+            else:
+                self.stderr.write('Export job {} failed: {}'.format(job.pk, job.error))
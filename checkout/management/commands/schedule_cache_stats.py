@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from checkout.schedule_cache import get_grid_cache_stats, reset_grid_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Reports how often week grids were served from the schedule cache. The counters are kept in the cache, ' \
+           'so they only cover every web process if CACHES is shared between them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Start counting again from zero after reporting')
+
+    def handle(self, *args, **options):
+        hits, misses = get_grid_cache_stats()
+        lookups = hits + misses
+        if lookups == 0:
+            self.stdout.write('No cached grids have been requested')
+        else:
+            self.stdout.write('{} hits, {} misses ({:.1%} hit rate)'.format(hits, misses, hits / lookups))
+
+        if options['reset']:
+            reset_grid_cache_stats()
+            self.stdout.write('✔ Reset the schedule cache counters')
@@ -0,0 +1,139 @@
+import threading
+import time
+from datetime import date, datetime
+from typing import Callable, Dict, List
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Sum
+
+from checkout.availability import claim_slots, InsufficientUnits
+from checkout.models import Site, TechnologyCategory, InventoryItem, SiteInventory, Classroom, Subject, Team, User, \
+    Period, Reservation
+
+STRESS_SITE_NAME = 'Stress Test Site'
+
+
+class Command(BaseCommand):
+    help = 'Books the same slots from many threads at once, checks that nothing was overbooked and compares ' \
+           'booking throughput between the ledger and the old read-then-insert booking paths. Meant to be run ' \
+           'against PostgreSQL - SQLite serializes writers and reports most contended attempts as errors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=25, help='Bookings attempted by each thread')
+        parser.add_argument('--units', type=int, default=3, help='Units requested by each booking')
+        parser.add_argument('--capacity', type=int, default=20, help='Units of the contended item')
+        parser.add_argument('--periods', type=int, default=2, help='Number of contended periods')
+
+    def handle(self, *args, **options):
+        periods: List[Period] = sorted(Period.objects.all())[:options['periods']]
+        if len(periods) == 0:
+            self.stderr.write("No periods found, please run 'python manage.py setup'")
+            exit(1)
+
+        if Site.objects.filter(name=STRESS_SITE_NAME).exists():
+            self.stderr.write("Site '{}' already exists, please delete it first".format(STRESS_SITE_NAME))
+            exit(1)
+
+        site, site_inventory, teams, classrooms, creator = self.create_fixtures(options)
+        try:
+            for name, book in [('read-then-insert', book_read_then_insert), ('ledger', book_with_ledger)]:
+                self.run_path(name, book, site_inventory, teams, classrooms, creator, periods, options)
+                Reservation.objects.filter(site_inventory=site_inventory).delete()
+        finally:
+            site.delete()
+            site_inventory.inventory.delete()
+
+    def create_fixtures(self, options):
+        site = Site.objects.create(name=STRESS_SITE_NAME)
+        category, _ = TechnologyCategory.objects.get_or_create(name='Stress Test Category')
+        inventory = InventoryItem.objects.create(
+            type=category, model_identifier='Stress test item', display_name='StressTest', units=options['capacity'])
+        site_inventory = SiteInventory.objects.create(site=site, inventory=inventory, units=options['capacity'])
+        subject, _ = Subject.objects.get_or_create(name=Subject.ACTIVITY_SUBJECT)
+        creator = User.objects.create(email='stress-test@{}.invalid'.format(id(site)), name='Stress Test', site=site)
+
+        # Each (thread, attempt) books with its own team and classroom to stay clear of the unique constraint
+        teams = [Team.objects.create(site=site, subject=subject) for _ in range(options['threads'])]
+        classrooms = [Classroom.objects.create(site=site, name='Stress Room {}'.format(i), code=str(i))
+                      for i in range(options['attempts'])]
+
+        return site, site_inventory, teams, classrooms, creator
+
+    def run_path(self, name: str, book: Callable, site_inventory: SiteInventory, teams: List[Team],
+                 classrooms: List[Classroom], creator: User, periods: List[Period], options):
+        today: date = datetime.now().date()
+        results: Dict[str, int] = {'booked': 0, 'rejected': 0, 'errors': 0}
+        results_lock = threading.Lock()
+        start_barrier = threading.Barrier(options['threads'])
+
+        def worker(team: Team):
+            start_barrier.wait()
+            try:
+                for attempt in range(options['attempts']):
+                    period = periods[attempt % len(periods)]
+                    try:
+                        outcome = 'booked' if book(site_inventory, today, period, options['units'], team,
+                                                   classrooms[attempt], creator) else 'rejected'
+                    except DatabaseError:
+                        outcome = 'errors'
+
+                    with results_lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(team,)) for team in teams]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+
+        overbooked = 0
+        for period in periods:
+            used = Reservation.objects.filter(site_inventory=site_inventory, date=today, period=period) \
+                       .aggregate(total=Sum('units'))['total'] or 0
+            if used > site_inventory.units:
+                overbooked += 1
+                self.stdout.write('! {}: {} has {} of {} units reserved'.format(name, period, used,
+                                                                                 site_inventory.units))
+
+        attempts = options['threads'] * options['attempts']
+        self.stdout.write('{}: {} attempts, {} booked, {} rejected, {} errors, {} overbooked periods, '
+                          '{:.1f} attempts/s ({:.3f}s)'.format(name, attempts, results['booked'], results['rejected'],
+                                                               results['errors'], overbooked, attempts / elapsed,
+                                                               elapsed))
+
+
+def book_read_then_insert(site_inventory: SiteInventory, request_date: date, period: Period, units: int, team: Team,
+                          classroom: Classroom, creator: User) -> bool:
+    """
+    The booking path reserve() used before the ledger: sum existing reservations, then insert.
+    """
+    with transaction.atomic():
+        used = Reservation.objects.filter(site_inventory=site_inventory, date=request_date, period=period) \
+                   .aggregate(total=Sum('units'))['total'] or 0
+        if units > site_inventory.units - used:
+            return False
+
+        Reservation.objects.create(team=team, site_inventory=site_inventory, classroom=classroom, units=units,
+                                   date=request_date, period=period, collaborative=False, creator=creator)
+        return True
+
+
+def book_with_ledger(site_inventory: SiteInventory, request_date: date, period: Period, units: int, team: Team,
+                     classroom: Classroom, creator: User) -> bool:
+    with transaction.atomic():
+        try:
+            claim_slots(site_inventory, [(request_date, period)], units)
+        except InsufficientUnits:
+            transaction.set_rollback(True)
+            return False
+
+        Reservation.objects.bulk_create([Reservation(
+            team=team, site_inventory=site_inventory, classroom=classroom, units=units, date=request_date, period=period,
+            collaborative=False, creator=creator)])
+        return True
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 15:46
+from __future__ import unicode_literals
+
+import json
+from datetime import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_week_days(apps, schema_editor):
+    Week = apps.get_model('checkout', 'Week')
+    WeekDay = apps.get_model('checkout', 'WeekDay')
+
+    for week in Week.objects.all():
+        days = sorted(datetime.strptime(date_str, '%Y-%m-%d').date() for date_str in json.loads(week.pickled_days))
+        if not days:
+            continue
+
+        week.first_day = days[0]
+        week.last_day = days[-1]
+        week.save(update_fields=['first_day', 'last_day'])
+        WeekDay.objects.bulk_create([WeekDay(week=week, site_id=week.site_id, date=day) for day in days])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0002_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeekDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='week',
+            name='first_day',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='week',
+            name='last_day',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='week',
+            index=models.Index(fields=['site', 'first_day', 'last_day'], name='checkout_we_site_id_8972b6_idx'),
+        ),
+        migrations.AddField(
+            model_name='weekday',
+            name='site',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.Site'),
+        ),
+        migrations.AddField(
+            model_name='weekday',
+            name='week',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.Week'),
+        ),
+        migrations.AddIndex(
+            model_name='weekday',
+            index=models.Index(fields=['site', 'date'], name='checkout_we_site_id_b69760_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='weekday',
+            unique_together=set([('week', 'date')]),
+        ),
+        migrations.RunPython(populate_week_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 15:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def populate_reserved_units(apps, schema_editor):
+    Reservation = apps.get_model('checkout', 'Reservation')
+    ReservedUnits = apps.get_model('checkout', 'ReservedUnits')
+
+    totals = Reservation.objects \
+        .values_list('site_inventory_id', 'date', 'period_id') \
+        .annotate(total_units=Sum('units')) \
+        .order_by()
+    ReservedUnits.objects.bulk_create(
+        [ReservedUnits(site_inventory_id=site_inventory_id, date=date, period_id=period_id, units=units)
+         for site_inventory_id, date, period_id, units in totals],
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0003_week_days'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservedUnits',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.Period')),
+                ('site_inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.SiteInventory')),
+            ],
+            options={
+                'verbose_name_plural': 'Reserved Units',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='reservedunits',
+            unique_together=set([('site_inventory', 'date', 'period')]),
+        ),
+        migrations.RunPython(populate_reserved_units, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 16:02
+from __future__ import unicode_literals
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0005_reservation_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedReservation',
+            fields=[
+                ('date', models.DateField()),
+                ('units', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('collaborative', models.BooleanField()),
+                ('comment', models.CharField(blank=True, max_length=1000, null=True)),
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('classroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.Classroom')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.Period')),
+                ('purpose', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='checkout.UsagePurpose')),
+                ('site_inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.SiteInventory')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.Team')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedreservation',
+            index=models.Index(fields=['team', 'date'], name='checkout_ar_team_id_f55a1f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedreservation',
+            index=models.Index(fields=['date'], name='checkout_ar_date_952494_idx'),
+        ),
+    ]
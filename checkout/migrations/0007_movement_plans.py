@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 16:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0006_archived_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovementPlan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('planner', models.CharField(max_length=20)),
+                ('plan', models.TextField()),
+                ('site_inventory', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='checkout.SiteInventory')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='movementplan',
+            unique_together=set([('site_inventory', 'date')]),
+        ),
+    ]
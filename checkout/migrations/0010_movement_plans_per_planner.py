@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 16:26
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0009_export_jobs'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='movementplan',
+            unique_together=set([('site_inventory', 'date', 'planner')]),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-16 15:44
+from __future__ import unicode_literals
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0010_movement_plans_per_planner'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='classroom',
+            name='code',
+            field=models.CharField(help_text='Up to 3 letters that identify classroom in the schedule view - e.g. 101, CAF', max_length=3),
+        ),
+        migrations.AlterField(
+            model_name='inventoryitem',
+            name='model_identifier',
+            field=models.CharField(help_text='e.g. Apple 13.3" MacBook Pro Mid 2017', max_length=200),
+        ),
+        migrations.AlterField(
+            model_name='inventoryitem',
+            name='units',
+            field=models.IntegerField(help_text='Total functional units Aim High has available', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AlterField(
+            model_name='siteinventory',
+            name='site',
+            field=models.ForeignKey(help_text='Site these units are assigned to', on_delete=django.db.models.deletion.CASCADE, to='checkout.Site'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 import json
 from datetime import datetime, date, timedelta
 from functools import total_ordering
-from typing import List
+from typing import Dict, List
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
@@ -161,9 +161,15 @@ class UsagePurpose(models.Model):
 
 
 @total_ordering
-class Reservation(models.Model):
+class AbstractReservation(models.Model):
+    """
+    Fields and ordering shared by current reservations and the archived ones (see checkout.archive).
+    """
+
     class Meta:
-        unique_together = (('team', 'site_inventory', 'classroom', 'date', 'period'),)
+        abstract = True
+
+    archived = False
 
     team = models.ForeignKey(Team)
     site_inventory = models.ForeignKey(SiteInventory)
@@ -175,6 +181,8 @@ class Reservation(models.Model):
     collaborative = models.BooleanField()
     creator = models.ForeignKey(settings.AUTH_USER_MODEL)
     comment = models.CharField(max_length=1000, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
 
     def __lt__(self, other):
         if self.date != other.date:
@@ -191,24 +199,171 @@ class Reservation(models.Model):
             self.period, self.classroom.name, self.team, self.units, self.site_inventory.inventory.display_name)
 
 
+class Reservation(AbstractReservation):
+    class Meta:
+        unique_together = (('team', 'site_inventory', 'classroom', 'date', 'period'),)
+        indexes = [
+            # Availability, the ledger and movements look up an item's reservations by day and period, and the
+            # schedule looks up a site's items over a range of days
+            models.Index(fields=['site_inventory', 'date', 'period']),
+            # My reservations, split into upcoming and past
+            models.Index(fields=['team', 'date']),
+            # Admin date hierarchy and filters
+            models.Index(fields=['date']),
+            # Incremental exports, which page through the reservations modified since a given time
+            models.Index(fields=['modified', 'id']),
+        ]
+
+
+class ArchivedReservation(AbstractReservation):
+    """
+    Reservation older than the archive cutoff, moved out of the reservations table by 'python manage.py
+    archive_reservations' so day to day queries don't have to skip over years of history. Keeps the id it had as a
+    reservation.
+    """
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['team', 'date']),
+            models.Index(fields=['date']),
+            models.Index(fields=['modified', 'id']),
+        ]
+
+    archived = True
+
+    id = models.IntegerField(primary_key=True)
+    # Copied from the reservation rather than set when it is archived
+    created = models.DateTimeField()
+    modified = models.DateTimeField()
+
+
+class ReservedUnits(models.Model):
+    """
+    Ledger of the total units reserved for an item in a period on a given day. Kept in step with Reservation by
+    signals (see checkout.availability) and rebuilt with 'python manage.py rebuild_reserved_units'.
+    """
+
+    class Meta:
+        verbose_name_plural = 'Reserved Units'
+        unique_together = (('site_inventory', 'date', 'period'),)
+
+    site_inventory = models.ForeignKey(SiteInventory)
+    date = models.DateField()
+    period = models.ForeignKey(Period)
+    units = models.IntegerField(default=0)
+
+    def __str__(self):
+        return "{} {} {} - {} units reserved".format(self.date, self.period, self.site_inventory, self.units)
+
+
+class MovementPlan(models.Model):
+    """
+    Movements planned for one item on one day, stored as JSON so the movements page doesn't re-plan items whose
+    reservations haven't changed. Deleted by signals whenever the plan could change, and planned again when next
+    needed (see checkout.movement_schedule).
+    """
+
+    class Meta:
+        # Plans from every planner are kept, so switching MOVEMENT_PLANNER back and forth doesn't clash with them
+        unique_together = (('site_inventory', 'date', 'planner'),)
+
+    site_inventory = models.ForeignKey(SiteInventory)
+    date = models.DateField()
+    planner = models.CharField(max_length=20)
+    plan = models.TextField()
+
+    def __str__(self):
+        return "{} {} ({})".format(self.date, self.site_inventory, self.planner)
+
+
+class ExportJob(models.Model):
+    """
+    Export of reservations written to a file under EXPORT_ROOT by 'python manage.py run_export_jobs', so that exports
+    too long for a request run in the background (see checkout.export_jobs).
+    """
+
+    class Meta:
+        indexes = [
+            # Workers take the oldest queued job
+            models.Index(fields=['status', 'created']),
+        ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    CSV = 'csv'
+    XLSX = 'xlsx'
+    FORMATS = [(CSV, 'CSV'), (XLSX, 'Excel')]
+
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL)
+    filters = models.TextField(help_text='Export filters as JSON (see checkout.export.EXPORT_FILTERS)')
+    format = models.CharField(max_length=10, choices=FORMATS)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    rows_total = models.IntegerField(null=True, blank=True)
+    rows_written = models.IntegerField(default=0)
+    file_name = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    def get_filters(self) -> Dict[str, str]:
+        return json.loads(self.filters)
+
+    def progress(self) -> int:
+        """
+        Percentage of the rows written so far.
+        """
+        if self.status == ExportJob.DONE:
+            return 100
+        if not self.rows_total:
+            return 0
+        return min(100, 100 * self.rows_written // self.rows_total)
+
+    def __str__(self):
+        return "Export {} ({}, {})".format(self.pk, self.get_format_display(), self.get_status_display())
+
+
 @total_ordering
 class Week(models.Model):
     class Meta:
         unique_together = (('site', 'week_number'),)
+        indexes = [models.Index(fields=['site', 'first_day', 'last_day'])]
 
     site = models.ForeignKey(Site)
     week_number = models.IntegerField(validators=[MinValueValidator(0)])
     pickled_days = models.CharField(max_length=1024)
 
+    # Derived from pickled_days on save, so weeks can be looked up by date
+    first_day = models.DateField(null=True, editable=False)
+    last_day = models.DateField(null=True, editable=False)
+
     def start_date(self) -> date:
-        return sorted(list(self.days()))[0]
+        return self.sorted_days()[0]
 
     def end_date(self) -> date:
-        return sorted(list(self.days()))[-1]
+        return self.sorted_days()[-1]
 
     def days(self) -> List[date]:
-        date_strs: List[str] = json.loads(self.pickled_days)
-        return [datetime.strptime(date_str, '%Y-%m-%d').date() for date_str in date_strs]
+        return list(self.parse_days()[0])
+
+    def sorted_days(self) -> List[date]:
+        return self.parse_days()[1]
+
+    def parse_days(self):
+        """
+        Parses pickled_days into (days, sorted days), re-parsing only when pickled_days has changed.
+        """
+        if getattr(self, '_parsed_days_source', None) != self.pickled_days:
+            date_strs: List[str] = json.loads(self.pickled_days)
+            days = [datetime.strptime(date_str, '%Y-%m-%d').date() for date_str in date_strs]
+            self._parsed_days = (days, sorted(days))
+            self._parsed_days_source = self.pickled_days
+
+        return self._parsed_days
 
     def calendar_days(self) -> List[date]:
         i: date = self.start_date()
@@ -220,6 +375,15 @@ class Week(models.Model):
 
         return calendar_days
 
+    def save(self, *args, **kwargs):
+        days: List[date] = self.sorted_days()
+        self.first_day = days[0] if days else None
+        self.last_day = days[-1] if days else None
+        super(Week, self).save(*args, **kwargs)
+
+        self.weekday_set.all().delete()
+        WeekDay.objects.bulk_create([WeekDay(week=self, site_id=self.site_id, date=day) for day in days])
+
     def __eq__(self, other):
         return self.site == other.site and self.week_number == other.week_number
 
@@ -227,11 +391,41 @@ class Week(models.Model):
         return self.week_number < other.week_number
 
     def __str__(self):
-        days: List[date] = list(self.days())
+        days: List[date] = self.sorted_days()
         return "{} - Week {} ({} days, {} - {})".format(
             self.site, self.week_number, len(days), self.start_date(), self.end_date())
 
 
+class WeekDay(models.Model):
+    """
+    One row per working day of a week, maintained by Week.save().
+    """
+
+    class Meta:
+        unique_together = (('week', 'date'),)
+        indexes = [models.Index(fields=['site', 'date'])]
+
+    week = models.ForeignKey(Week)
+    site = models.ForeignKey(Site)
+    date = models.DateField()
+
+    def __str__(self):
+        return "{} - {}".format(self.week, self.date)
+
+
+class DataVersion(models.Model):
+    """
+    Change marker for data that is cached outside the database. The version is bumped whenever the data it covers
+    changes, so anything cached under an older version is never served again.
+    """
+    key = models.CharField(max_length=150, primary_key=True)
+    version = models.IntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} (version {})".format(self.key, self.version)
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     class Meta:
         unique_together = (('site', 'name'),)
@@ -1,11 +1,23 @@
+import json
 import logging
 
 from collections import defaultdict, OrderedDict
-from typing import Dict
+from typing import Callable, Dict, Iterable, Set, Tuple
 
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Q
+
+from checkout.identity_map import IdentityMap
 from checkout.models import *
+from checkout.reference_data import get_periods
+from checkout.reservation_schedule import get_site_inventory, get_reservations
+from checkout.schedule_cache import get_site_version
+
+ItemReservations = Dict[Tuple[int, date, int], List[Reservation]]
 
 DEFAULT_STORAGE_LOCATION = "Site Director's Office"
+MOVEMENT_PLANNER = getattr(settings, 'MOVEMENT_PLANNER', 'greedy')
 logger = logging.getLogger(__name__)
 
 
@@ -45,9 +57,9 @@ def order_candidates(reservation: Reservation, units_by_location: Dict[Classroom
 def get_movement_periods() -> List[Period]:
     movement_periods = []
     last_normal_period_number = 0
-    for period in sorted(list(Period.objects.all())):
-        period.name = "Before " + period.name
-        movement_periods.append(period)
+    for period in get_periods():
+        # Copied, the cached periods are shared
+        movement_periods.append(Period(pk=period.pk, number=period.number, name="Before " + period.name))
         if period.number > last_normal_period_number:
             last_normal_period_number = period.number
 
@@ -55,8 +67,145 @@ def get_movement_periods() -> List[Period]:
     return movement_periods
 
 
+def bucket_item_reservations(reservations: Iterable[Reservation]) -> ItemReservations:
+    """
+    Groups reservations by (site inventory id, date, period id), keeping their order.
+    """
+    buckets: ItemReservations = defaultdict(list)
+    for reservation in reservations:
+        buckets[(reservation.site_inventory_id, reservation.date, reservation.period_id)].append(reservation)
+
+    return buckets
+
+
+def get_movement_schedules(site: Site, days: List[date], identity_map: IdentityMap = None,
+                           use_stored_plans: bool = True) -> List['MovementSchedule']:
+    """
+    Assembles the movements of every working day in a week from the stored plans. Only the items and days without a
+    current plan are planned, from a single load of the week's reservations, and their plans are stored. Without
+    use_stored_plans, everything is planned and nothing is stored.
+    """
+    if identity_map is None:
+        identity_map = IdentityMap()
+
+    items: List[SiteInventory] = get_site_inventory(site)
+    periods: List[Period] = get_movement_periods()
+    plans: Dict[Tuple[int, date], Dict[Period, List[Movement]]] = {}
+
+    stored_plans: List[Tuple[int, date, str]] = []
+    if use_stored_plans:
+        stored_plans = list(MovementPlan.objects
+                            .filter(site_inventory__in=items, date__in=days, planner=MOVEMENT_PLANNER)
+                            .values_list('site_inventory_id', 'date', 'plan'))
+    if len(stored_plans) > 0:
+        identity_map.add_all(Classroom.objects.filter(site=site))
+        items_by_pk: Dict[int, SiteInventory] = {item.pk: item for item in items}
+        for site_inventory_id, plan_date, plan in stored_plans:
+            item = items_by_pk[site_inventory_id]
+            plans[(item.pk, plan_date)] = load_plan(plan, item, get_storage_location(site, item), periods,
+                                                    identity_map)
+
+    if len(plans) < len(items) * len(days):
+        # Plans made from reservations that change in the meantime must not be stored
+        version: int = get_site_version(site).version
+        buckets: ItemReservations = bucket_item_reservations(
+            sorted(get_reservations(site, days, identity_map), key=lambda reservation: reservation.pk))
+
+        new_plans: List[MovementPlan] = []
+        for day in days:
+            for item in items:
+                if (item.pk, day) not in plans:
+                    plans[(item.pk, day)] = plan_item(site, item, day, periods, buckets)
+                    new_plans.append(MovementPlan(site_inventory=item, date=day, planner=MOVEMENT_PLANNER,
+                                                  plan=dump_plan(plans[(item.pk, day)])))
+
+        if use_stored_plans and get_site_version(site).version == version:
+            try:
+                with transaction.atomic():
+                    MovementPlan.objects.bulk_create(new_plans)
+            except IntegrityError:
+                # Another request stored some of them first - that is the only clash expected here
+                stored: Set[Tuple[int, date]] = set(
+                    MovementPlan.objects.filter(site_inventory__in=items, date__in=days, planner=MOVEMENT_PLANNER)
+                    .values_list('site_inventory_id', 'date'))
+                if stored.isdisjoint((plan.site_inventory_id, plan.date) for plan in new_plans):
+                    raise
+
+            # A reservation committed between the check above and the insert had nothing to invalidate yet
+            if get_site_version(site).version != version:
+                invalidate_movement_plans((plan.site_inventory_id, plan.date) for plan in new_plans)
+
+    return [MovementSchedule(site, day, items, plans={item.pk: plans[(item.pk, day)] for item in items})
+            for day in days]
+
+
+def get_storage_location(site: Site, item: SiteInventory) -> Classroom:
+    return Classroom(pk=0, site=site, code="DEF", name=item.storage_location)
+
+
+def plan_item(site: Site, item: SiteInventory, date: date, periods: List[Period], buckets: ItemReservations,
+              planner: str = None) -> Dict[Period, List[Movement]]:
+    """
+    Plans one item's movements on one day with the given planner (MOVEMENT_PLANNER by default).
+    """
+    movements: Dict[Period, List[Movement]] = OrderedDict((period, []) for period in periods)
+    period_reservations = [buckets.get((item.pk, date, period.pk), []) for period in periods]
+    MOVEMENT_PLANNERS[planner or MOVEMENT_PLANNER](item, get_storage_location(site, item), periods,
+                                                   period_reservations, movements)
+    return movements
+
+
+def dump_plan(movements: Dict[Period, List[Movement]]) -> str:
+    """
+    Serializes an item's movements by period, with classrooms by id (0 is the item's storage location).
+    """
+    return json.dumps({str(period.pk): [[movement.units, movement.origin.pk, movement.destination.pk,
+                                         movement.comment] for movement in period_movements]
+                       for period, period_movements in movements.items() if len(period_movements) > 0})
+
+
+def load_plan(plan: str, item: SiteInventory, storage_location: Classroom, periods: List[Period],
+              identity_map: IdentityMap) -> Dict[Period, List[Movement]]:
+    stored_movements = json.loads(plan)
+    movements: Dict[Period, List[Movement]] = OrderedDict()
+    for period in periods:
+        movements[period] = []
+        for units, origin_pk, destination_pk, comment in stored_movements.get(str(period.pk), []):
+            origin = identity_map.get(Classroom, origin_pk) if origin_pk else storage_location
+            destination = identity_map.get(Classroom, destination_pk) if destination_pk else storage_location
+            movements[period].append(Movement(item, units, origin, destination, comment))
+
+    return movements
+
+
+def invalidate_movement_plans(item_days: Iterable[Tuple[int, date]]):
+    """
+    Deletes the stored plans of the given (site inventory id, date) pairs, so they are planned again when next
+    needed. Inside a transaction they are deleted again once it commits: until then other requests still plan from
+    the old reservations, and may store those plans after the first delete.
+    """
+    item_dates: Dict[int, set] = defaultdict(set)
+    for site_inventory_id, plan_date in item_days:
+        item_dates[site_inventory_id].add(plan_date)
+
+    query = Q()
+    for site_inventory_id, plan_dates in item_dates.items():
+        query |= Q(site_inventory_id=site_inventory_id, date__in=plan_dates)
+
+    if len(query) > 0:
+        MovementPlan.objects.filter(query).delete()
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: MovementPlan.objects.filter(query).delete())
+
+
 class MovementSchedule:
-    def __init__(self, site: Site, date: date):
+    def __init__(self, site: Site, date: date, items: List[SiteInventory] = None, buckets: ItemReservations = None,
+                 planner: str = None, plans: Dict[int, Dict[Period, List[Movement]]] = None):
+        """
+        Plans the movements of a single day with the given planner (MOVEMENT_PLANNER by default). The items,
+        reservations and the movements already planned for some items can be passed in pre-loaded (see
+        get_movement_schedules) - anything that is omitted is queried for this day only.
+        """
         self.date: datetime.date = date
         self.periods: List[PeriodMovements] = []
         movements: Dict[Period, List[Movement]] = OrderedDict()
@@ -65,66 +214,219 @@ class MovementSchedule:
         for period in periods:
             movements[period] = []
 
-        items = list(site.siteinventory_set.all())
-        for item in items:
-            storage_location = item.storage_location
+        if items is None:
+            items = get_site_inventory(site)
+        if plans is None:
+            plans = {}
+        if buckets is None and any(item.pk not in plans for item in items):
+            buckets = bucket_item_reservations(
+                sorted(get_reservations(site, [date]), key=lambda reservation: reservation.pk))
 
-            storage_location = Classroom(pk=0, site=site, code="DEF", name=storage_location)
-            origin = storage_location
-
-            # Assumption: All items can be picked up at the beginning of the day at the storage location
-            units_by_location: Dict[Classroom, int] = {origin: item.units}
+        for item in items:
+            item_movements = plans.get(item.pk)
+            if item_movements is None:
+                item_movements = plan_item(site, item, date, periods, buckets, planner)
 
             for period in periods:
-                postmove_units_by_location: Dict[Classroom, int] = defaultdict(int)
-                reservations = list(Reservation.objects.filter(site_inventory=item, date=date, period=period).all())
-                sorted_reservations = sorted(reservations, key=lambda x: x.units, reverse=True)
-
-                for reservation in sorted_reservations:
-                    remaining_units = reservation.units
-                    while remaining_units > 0:
-                        candidates = order_candidates(reservation, units_by_location)
-                        if len(candidates) <= 0:
-                            # Some reservations cannot be serviced (site inventory has reduced)
-                            logger.warning("Cannot satisfy reservation %s (units required: %s, available: %s)",
-                                           reservation, remaining_units, units_by_location)
-                            break
-
-                        for origin, available_count in candidates:
-                            moved_units = min(remaining_units, available_count)
-
-                            assert moved_units > 0
-                            destination = reservation.classroom
-
-                            if origin != destination:
-                                movements[period].append(
-                                    Movement(item, moved_units, origin, destination, reservation.comment))
-
-                            postmove_units_by_location[destination] += moved_units
-                            remaining_units -= moved_units
-
-                            units_by_location[origin] -= moved_units
-                            if units_by_location[origin] == 0:
-                                del units_by_location[origin]
-
-                            break
-
-                # Send all unused items back to storage location
-                for location, count in list(units_by_location.items()):
-                    if location != storage_location:
-                        movements[period].append(Movement(item, count, location, storage_location))
-                    postmove_units_by_location[storage_location] += count
-
-                # Update units_by_location
-                units_by_location = {}
-                for location, count in postmove_units_by_location.items():
-                    if count > 0:
-                        units_by_location[location] = count
+                movements[period] += item_movements[period]
 
         for period in movements:
             self.periods.append(PeriodMovements(period, sorted(movements[period])))
 
 
+def plan_item_greedy(item: SiteInventory, storage_location: Classroom, periods: List[Period],
+                     period_reservations: List[List[Reservation]], movements: Dict[Period, List[Movement]]):
+    """
+    Serves the largest reservations first, each from its own classroom if the units are already there and otherwise
+    from wherever most units are, then sends every unused unit back to storage.
+    """
+    origin = storage_location
+
+    # Assumption: All items can be picked up at the beginning of the day at the storage location
+    units_by_location: Dict[Classroom, int] = {origin: item.units}
+
+    for period, reservations in zip(periods, period_reservations):
+        postmove_units_by_location: Dict[Classroom, int] = defaultdict(int)
+        sorted_reservations = sorted(reservations, key=lambda x: x.units, reverse=True)
+
+        for reservation in sorted_reservations:
+            remaining_units = reservation.units
+            while remaining_units > 0:
+                candidates = order_candidates(reservation, units_by_location)
+                if len(candidates) <= 0:
+                    # Some reservations cannot be serviced (site inventory has reduced)
+                    logger.warning("Cannot satisfy reservation %s (units required: %s, available: %s)",
+                                   reservation, remaining_units, units_by_location)
+                    break
+
+                for origin, available_count in candidates:
+                    moved_units = min(remaining_units, available_count)
+
+                    assert moved_units > 0
+                    destination = reservation.classroom
+
+                    if origin != destination:
+                        movements[period].append(
+                            Movement(item, moved_units, origin, destination, reservation.comment))
+
+                    postmove_units_by_location[destination] += moved_units
+                    remaining_units -= moved_units
+
+                    units_by_location[origin] -= moved_units
+                    if units_by_location[origin] == 0:
+                        del units_by_location[origin]
+
+                    break
+
+        # Send all unused items back to storage location
+        for location, count in list(units_by_location.items()):
+            if location != storage_location:
+                movements[period].append(Movement(item, count, location, storage_location))
+            postmove_units_by_location[storage_location] += count
+
+        # Update units_by_location
+        units_by_location = {}
+        for location, count in postmove_units_by_location.items():
+            if count > 0:
+                units_by_location[location] = count
+
+
+def plan_item_optimal(item: SiteInventory, storage_location: Classroom, periods: List[Period],
+                      period_reservations: List[List[Reservation]], movements: Dict[Period, List[Movement]]):
+    """
+    Solves each period's moves as a transportation problem that moves as few units as possible. Units that aren't
+    needed stay where they are if a later period that day needs them in the same classroom, and only the rest go
+    back to storage. Serves the same units as the greedy planner when there aren't enough for every reservation.
+    """
+    # Units wanted in each classroom in each period, and the reservations they are for
+    demands: List[Dict[Classroom, int]] = []
+    comments: List[Dict[Classroom, List[str]]] = []
+    for reservations in period_reservations:
+        demand: Dict[Classroom, int] = OrderedDict()
+        period_comments: Dict[Classroom, List[str]] = defaultdict(list)
+        available = item.units
+        for reservation in sorted(reservations, key=lambda x: x.units, reverse=True):
+            served = min(reservation.units, available)
+            if served < reservation.units:
+                logger.warning("Cannot satisfy reservation %s (units required: %s, available: %s)",
+                               reservation, reservation.units - served, available)
+            if served > 0:
+                demand[reservation.classroom] = demand.get(reservation.classroom, 0) + served
+                if reservation.comment:
+                    period_comments[reservation.classroom].append(reservation.comment)
+            available -= served
+        demands.append(demand)
+        comments.append(period_comments)
+
+    # Assumption: All items can be picked up at the beginning of the day at the storage location
+    units_by_location: Dict[Classroom, int] = {storage_location: item.units}
+
+    for index, period in enumerate(periods):
+        demand = demands[index]
+        idle_units = item.units - sum(demand.values())
+
+        # Units a later period needs where they are cost a second move to take away, the rest only one
+        sources: List[Tuple[Classroom, int, bool]] = []
+        for location, count in units_by_location.items():
+            needed_later = max([later_demand.get(location, 0) for later_demand in demands[index + 1:]] or [0])
+            kept = min(count, needed_later)
+            if kept > 0:
+                sources.append((location, kept, True))
+            if count > kept:
+                sources.append((location, count - kept, False))
+
+        destinations: List[Classroom] = list(demand.keys())
+        cost: List[List[int]] = []
+        for location, _, kept in sources:
+            move_cost = 2 if kept else 1
+            row = [0 if destination == location else move_cost for destination in destinations]
+            # Idle units stay put if they're needed later, and go back to storage otherwise
+            row.append(0 if kept or location == storage_location else 1)
+            cost.append(row)
+
+        flows = solve_transportation([count for _, count, _ in sources],
+                                     [demand[destination] for destination in destinations] + [idle_units], cost)
+
+        moved: Dict[Tuple[Classroom, Classroom], int] = OrderedDict()
+        postmove_units_by_location: Dict[Classroom, int] = defaultdict(int)
+        for (location, _, kept), row in zip(sources, flows):
+            for destination, units in zip(destinations + [None], row):
+                if units == 0:
+                    continue
+                if destination is None:
+                    destination = location if kept else storage_location
+                if destination != location:
+                    moved[(location, destination)] = moved.get((location, destination), 0) + units
+                postmove_units_by_location[destination] += units
+
+        for (origin, destination), units in moved.items():
+            comment = "; ".join(comments[index].get(destination, [])) or None
+            movements[period].append(Movement(item, units, origin, destination, comment))
+
+        units_by_location = {location: count for location, count in postmove_units_by_location.items() if count > 0}
+
+
+def solve_transportation(supply: List[int], demand: List[int], cost: List[List[int]]) -> List[List[int]]:
+    """
+    Returns how many units to send from each source to each destination so that every source sends its supply and
+    every destination receives its demand (the totals must match) at the lowest total cost, by successive shortest
+    paths. Sized for a site's classrooms - a few dozen nodes - rather than for large networks.
+    """
+    flows: List[List[int]] = [[0] * len(demand) for _ in supply]
+    supply, demand = list(supply), list(demand)
+    node_count = len(supply) + len(demand)
+    infinity = float('inf')
+
+    while any(demand):
+        # Cheapest path from any source with supply left to every node, in the residual network. Destination nodes
+        # come after the sources, and units already sent can be sent back at negative cost.
+        distance = [0 if units > 0 else infinity for units in supply] + [infinity] * len(demand)
+        previous: List[int] = [-1] * node_count
+        for _ in range(node_count):
+            changed = False
+            for source, row in enumerate(cost):
+                for destination, edge_cost in enumerate(row):
+                    node = len(supply) + destination
+                    if distance[source] + edge_cost < distance[node]:
+                        distance[node] = distance[source] + edge_cost
+                        previous[node] = source
+                        changed = True
+                    if flows[source][destination] > 0 and distance[node] - edge_cost < distance[source]:
+                        distance[source] = distance[node] - edge_cost
+                        previous[source] = node
+                        changed = True
+            if not changed:
+                break
+
+        target = min((node for node in range(len(supply), node_count) if demand[node - len(supply)] > 0),
+                     key=lambda node: distance[node])
+        path = [target]
+        while previous[path[-1]] != -1:
+            path.append(previous[path[-1]])
+        path.reverse()
+
+        units = min(supply[path[0]], demand[target - len(supply)])
+        for start, end in zip(path, path[1:]):
+            if end < len(supply):
+                units = min(units, flows[end][start - len(supply)])
+
+        for start, end in zip(path, path[1:]):
+            if start < len(supply):
+                flows[start][end - len(supply)] += units
+            else:
+                flows[end][start - len(supply)] -= units
+        supply[path[0]] -= units
+        demand[target - len(supply)] -= units
+
+    return flows
+
+
+MOVEMENT_PLANNERS: Dict[str, Callable] = {
+    'greedy': plan_item_greedy,
+    'optimal': plan_item_optimal,
+}
+
+
 class PeriodMovements:
     def __init__(self, period: Period, movements: List[Movement]):
         self.period: Period = period
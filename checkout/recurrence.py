@@ -0,0 +1,40 @@
+from datetime import date, datetime
+from typing import Iterable, Optional
+
+from checkout.models import *
+
+
+def get_recurrence_dates(site: Site, first_date: date, until_week: Optional[Week] = None,
+                         extra_dates: Iterable[date] = ()) -> List[date]:
+    """
+    Returns the days a recurring reservation falls on: the first date, the same weekday of every following week up to
+    and including until_week, and any extra dates. Apart from the first date, only days that belong to one of the
+    site's configured weeks are kept. Takes a single query.
+    """
+    extra_dates = set(extra_dates)
+    repeat_until: date = until_week.last_day if until_week is not None and until_week.last_day else first_date
+    last_date: date = max(first_date, repeat_until)
+    if len(extra_dates) > 0:
+        last_date = max(last_date, max(extra_dates))
+
+    working_days = WeekDay.objects \
+        .filter(site=site, date__range=(min(extra_dates | {first_date}), last_date)) \
+        .values_list('date', flat=True) \
+        .distinct()
+
+    dates = {first_date}
+    for working_day in working_days:
+        if working_day in extra_dates:
+            dates.add(working_day)
+        elif first_date < working_day <= repeat_until and working_day.weekday() == first_date.weekday():
+            dates.add(working_day)
+
+    return sorted(dates)
+
+
+def parse_dates(dates_str: str) -> List[date]:
+    """
+    Parses a comma or whitespace separated list of YYYY-MM-DD dates, raising ValueError for anything else.
+    """
+    return [datetime.strptime(date_str, '%Y-%m-%d').date()
+            for date_str in dates_str.replace(',', ' ').split()]
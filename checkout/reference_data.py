@@ -0,0 +1,116 @@
+import logging
+import threading
+from typing import Optional
+
+from django.db.models import F
+
+from checkout.models import *
+
+logger = logging.getLogger(__name__)
+
+REFERENCE_VERSION_KEY = 'reference'
+
+
+class ReferenceData:
+    """
+    Snapshot of the lookup tables that almost every page needs and that rarely change. The instances are shared by
+    every request in the process, so they must be treated as read-only - copy them before changing anything.
+    """
+
+    def __init__(self, version: int):
+        self.version: int = version
+        self.periods: List[Period] = sorted(Period.objects.all())
+        self.sites: List[Site] = list(Site.objects.order_by('name'))
+        self.categories: List[TechnologyCategory] = list(TechnologyCategory.objects.order_by('pk'))
+        self.purposes: List[UsagePurpose] = list(UsagePurpose.objects.order_by('pk'))
+        self.subjects: List[Subject] = list(Subject.objects.order_by('name'))
+
+
+_lock = threading.Lock()
+_reference_data: Optional[ReferenceData] = None
+
+
+def get_reference_version() -> int:
+    return DataVersion.objects.filter(key=REFERENCE_VERSION_KEY).values_list('version', flat=True).first() or 0
+
+
+def get_reference_data() -> ReferenceData:
+    global _reference_data
+    reference_data = _reference_data
+    if reference_data is None:
+        with _lock:
+            if _reference_data is None:
+                # Read the version first, so a change made while loading is picked up by the next check
+                _reference_data = ReferenceData(get_reference_version())
+                logger.debug("Loaded reference data (version %s)", _reference_data.version)
+            reference_data = _reference_data
+
+    return reference_data
+
+
+def check_reference_version():
+    """
+    Drops this process' reference data if another process has changed it since it was loaded.
+    """
+    global _reference_data
+    reference_data = _reference_data
+    if reference_data is not None and reference_data.version != get_reference_version():
+        with _lock:
+            if _reference_data is reference_data:
+                _reference_data = None
+
+
+def invalidate_reference_data():
+    """
+    Drops this process' reference data and bumps the shared version so every other process drops theirs too.
+    """
+    global _reference_data
+    with _lock:
+        _reference_data = None
+
+    updated = DataVersion.objects.filter(key=REFERENCE_VERSION_KEY).update(
+        version=F('version') + 1, modified=datetime.now())
+    if not updated:
+        DataVersion.objects.get_or_create(key=REFERENCE_VERSION_KEY, defaults={'version': 1})
+
+
+def get_periods() -> List[Period]:
+    return list(get_reference_data().periods)
+
+
+def get_period(period_pk) -> Optional[Period]:
+    return next((period for period in get_reference_data().periods if str(period.pk) == str(period_pk)), None)
+
+
+def get_sites() -> List[Site]:
+    return list(get_reference_data().sites)
+
+
+def get_categories() -> List[TechnologyCategory]:
+    return list(get_reference_data().categories)
+
+
+def get_category(category_pk) -> Optional[TechnologyCategory]:
+    return next((category for category in get_reference_data().categories if str(category.pk) == str(category_pk)),
+                None)
+
+
+def get_purposes() -> List[UsagePurpose]:
+    return list(get_reference_data().purposes)
+
+
+def get_subjects() -> List[Subject]:
+    return list(get_reference_data().subjects)
+
+
+class ReferenceDataMiddleware:
+    """
+    Checks once per request that the reference data cached by this process is still current.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        check_reference_version()
+        return self.get_response(request)
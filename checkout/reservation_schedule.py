@@ -1,36 +1,44 @@
 import datetime
 
-from collections import defaultdict
-from typing import Dict
+from collections import defaultdict, OrderedDict
+from typing import Dict, Iterable, Tuple
 
+from checkout.identity_map import IdentityMap
 from checkout.models import *
+from checkout.reference_data import get_periods
+
+ReservationBuckets = Dict[Tuple[datetime.date, int, int], List[Reservation]]
 
 
 class ReservationSchedule:
-    def __init__(self, site: Site, schedule_date: datetime.date):
+    def __init__(self, site: Site, schedule_date: datetime.date, site_inventory_list: List[SiteInventory] = None,
+                 periods: List[Period] = None, buckets: ReservationBuckets = None):
+        """
+        Builds the availability of every period on a single day. The site inventory, periods and reservations can be
+        passed in pre-loaded (see get_week_schedule) - anything that is omitted is queried for this day only.
+        """
         self.date: datetime.date = schedule_date
         self.periods: List[PeriodInfo] = []
 
-        site_inventory_list: List[SiteInventory] = list(site.siteinventory_set.all())
-        periods: List[Period] = sorted(list(Period.objects.all()))
-        assignments: List[Reservation] = \
-            list(Reservation.objects.filter(site_inventory__site=site, date=self.date).all())
+        if site_inventory_list is None:
+            site_inventory_list = get_site_inventory(site)
+        if periods is None:
+            periods = get_periods()
+        if buckets is None:
+            buckets = bucket_reservations(get_reservations(site, [schedule_date]))
 
-        grouped_inventory: Dict[TechnologyCategory, List[SiteInventory]] = defaultdict(list)
-        grouped_inventory_totals: Dict[TechnologyCategory, int] = defaultdict(int)
+        grouped_inventory_totals: Dict[TechnologyCategory, int] = OrderedDict()
         for inventory in site_inventory_list:
-            grouped_inventory[inventory.inventory.type].append(inventory)
-            grouped_inventory_totals[inventory.inventory.type] += inventory.units
+            category: TechnologyCategory = inventory.inventory.type
+            grouped_inventory_totals[category] = grouped_inventory_totals.get(category, 0) + inventory.units
 
         for period in periods:
             reservations = []
             period_inventory = grouped_inventory_totals.copy()
-            for category in grouped_inventory.keys():
-                for site_inventory in grouped_inventory[category]:
-                    for assignment in assignments:
-                        if assignment.period == period and assignment.site_inventory == site_inventory:
-                            reservations.append(assignment)
-                            period_inventory[category] = max(0, period_inventory[category] - assignment.units)
+            for category in grouped_inventory_totals.keys():
+                for assignment in buckets.get((self.date, period.pk, category.pk), []):
+                    reservations.append(assignment)
+                    period_inventory[category] = max(0, period_inventory[category] - assignment.units)
 
             self.periods.append(PeriodInfo(period, period_inventory, reservations))
 
@@ -47,3 +55,56 @@ class PeriodInfo:
 
     def __str__(self):
         return "{} - Free ({}), Used ({})".format(self.period.number, self.free, self.reservations)
+
+
+def get_site_inventory(site: Site) -> List[SiteInventory]:
+    return list(site.siteinventory_set.select_related('inventory__type').order_by('pk'))
+
+
+def get_reservations(site: Site, days: List[datetime.date], identity_map: IdentityMap = None) -> List[Reservation]:
+    """
+    Loads every reservation at the site between the first and last of the given days in a single query, ordered the
+    same way the schedule lists them (by item, then by creation). Their items, classrooms and periods come from the
+    identity map, which loads those it doesn't have yet.
+    """
+    if identity_map is None:
+        identity_map = IdentityMap()
+
+    reservations = list(Reservation.objects
+                        .filter(site_inventory__site=site, date__range=(min(days), max(days)))
+                        .order_by('site_inventory_id', 'pk'))
+    identity_map.attach(reservations, 'site_inventory', SiteInventory.objects.select_related('inventory__type'))
+    identity_map.attach(reservations, 'classroom')
+    identity_map.attach(reservations, 'period')
+    return reservations
+
+
+def bucket_reservations(reservations: Iterable[Reservation]) -> ReservationBuckets:
+    """
+    Groups reservations by (date, period, technology category).
+    """
+    buckets: ReservationBuckets = defaultdict(list)
+    for reservation in reservations:
+        buckets[(reservation.date, reservation.period_id, reservation.site_inventory.inventory.type_id)].append(
+            reservation)
+
+    return buckets
+
+
+def get_week_schedule(site: Site, days: List[datetime.date], identity_map: IdentityMap = None) -> \
+        List[ReservationSchedule]:
+    """
+    Builds a ReservationSchedule for each of the given days from one load of the site's items and one of its
+    reservations for the whole range of days.
+    """
+    if len(days) == 0:
+        return []
+
+    if identity_map is None:
+        identity_map = IdentityMap()
+
+    site_inventory_list: List[SiteInventory] = identity_map.add_all(get_site_inventory(site))
+    periods: List[Period] = get_periods()
+    buckets: ReservationBuckets = bucket_reservations(get_reservations(site, days, identity_map))
+
+    return [ReservationSchedule(site, day, site_inventory_list, periods, buckets) for day in days]
@@ -0,0 +1,84 @@
+import logging
+from typing import Callable, Tuple
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from checkout.models import *
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_CACHE_TIMEOUT = getattr(settings, 'SCHEDULE_CACHE_TIMEOUT', 60 * 60)
+
+# Counted in the cache itself, so that they add up across every process sharing it
+GRID_HITS_KEY = 'grid:hits'
+GRID_MISSES_KEY = 'grid:misses'
+
+
+def site_version_key(site_pk: str) -> str:
+    return "site:" + site_pk
+
+
+def get_site_version(site: Site) -> DataVersion:
+    data_version, _ = DataVersion.objects.get_or_create(key=site_version_key(site.pk))
+    return data_version
+
+
+def get_site_versions(site_pks: List[str]) -> List[DataVersion]:
+    return list(DataVersion.objects.filter(key__in=[site_version_key(site_pk) for site_pk in set(site_pks)]))
+
+
+def bump_site_version(site_pk: str):
+    key = site_version_key(site_pk)
+    updated = DataVersion.objects.filter(key=key).update(version=F('version') + 1, modified=datetime.now())
+    if not updated:
+        DataVersion.objects.get_or_create(key=key, defaults={'version': 1})
+
+
+def bump_all_site_versions():
+    DataVersion.objects.filter(key__startswith=site_version_key('')).update(
+        version=F('version') + 1, modified=datetime.now())
+
+
+def get_cached_grid(kind: str, site: Site, week: Week, build_grid: Callable):
+    """
+    Returns the grid for a site and week, building it with build_grid() only if nothing is cached for the site's
+    current data version.
+    """
+    data_version: DataVersion = get_site_version(site)
+    key = "grid:{}:{}:{}:{}".format(kind, quote(site.pk), week.week_number, data_version.version)
+
+    grid = cache.get(key)
+    if grid is not None:
+        logger.debug("Schedule cache hit for %s (%s hits)", key, count_grid_lookup(GRID_HITS_KEY))
+        return grid
+
+    logger.debug("Schedule cache miss for %s (%s misses)", key, count_grid_lookup(GRID_MISSES_KEY))
+    grid = build_grid()
+    cache.set(key, grid, SCHEDULE_CACHE_TIMEOUT)
+    return grid
+
+
+def count_grid_lookup(counter_key: str) -> int:
+    # add() leaves a counter another process already started alone, and incr() is atomic in shared caches
+    cache.add(counter_key, 0, None)
+    try:
+        return cache.incr(counter_key)
+    except ValueError:
+        # Evicted in between
+        cache.set(counter_key, 1, None)
+        return 1
+
+
+def get_grid_cache_stats() -> Tuple[int, int]:
+    """
+    Returns the number of cached grid hits and misses since the counters were last reset.
+    """
+    counters = cache.get_many([GRID_HITS_KEY, GRID_MISSES_KEY])
+    return counters.get(GRID_HITS_KEY, 0), counters.get(GRID_MISSES_KEY, 0)
+
+
+def reset_grid_cache_stats():
+    cache.delete_many([GRID_HITS_KEY, GRID_MISSES_KEY])
@@ -0,0 +1,45 @@
+import datetime
+
+from typing import Dict, Tuple
+
+from checkout.models import *
+
+
+class ScheduleCell:
+    def __init__(self, calendar_day: datetime.date, work_day, period_details):
+        self.date: datetime.date = calendar_day
+        self.work_day = work_day
+        self.period_details = period_details
+
+
+class ScheduleRow:
+    def __init__(self, period: Period, cells: List[ScheduleCell]):
+        self.period: Period = period
+        self.cells: List[ScheduleCell] = cells
+
+
+class ScheduleGrid:
+    """
+    Lines up a week of day schedules (ReservationSchedule or MovementSchedule - anything with a date and a list of
+    periods) into one row per period and one cell per calendar day, so templates don't have to search for the
+    matching day and period themselves.
+    """
+
+    def __init__(self, periods: List[Period], calendar_days: List[datetime.date], schedule: List):
+        self.cells: Dict[Tuple[datetime.date, int], ScheduleCell] = {}
+        for work_day in schedule:
+            for period_details in work_day.periods:
+                key = (work_day.date, period_details.period.pk)
+                self.cells[key] = ScheduleCell(work_day.date, work_day, period_details)
+
+        self.rows: List[ScheduleRow] = []
+        for period in periods:
+            cells = [self.cell(calendar_day, period) or ScheduleCell(calendar_day, None, None)
+                     for calendar_day in calendar_days]
+            self.rows.append(ScheduleRow(period, cells))
+
+    def cell(self, calendar_day: datetime.date, period: Period) -> ScheduleCell:
+        return self.cells.get((calendar_day, period.pk))
+
+    def __len__(self):
+        return len(self.cells)
@@ -0,0 +1,122 @@
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
+from django.dispatch import receiver, Signal
+
+from checkout.availability import add_reserved_units, remove_reserved_units
+from checkout.models import *
+from checkout.movement_schedule import invalidate_movement_plans
+from checkout.reference_data import invalidate_reference_data
+from checkout.schedule_cache import bump_site_version, bump_all_site_versions
+
+# Sent after reservations are inserted with bulk_create(), which skips post_save. Their units must already have been
+# claimed in the ledger (see checkout.availability.claim_slots).
+reservations_created = Signal(providing_args=['reservations'])
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def reservation_changed(sender, instance: Reservation, **kwargs):
+    # Looked up by id because the site inventory may be in the middle of a cascading delete
+    site_pk = SiteInventory.objects.filter(pk=instance.site_inventory_id).values_list('site_id', flat=True).first()
+    if site_pk is not None:
+        bump_site_version(site_pk)
+
+
+@receiver(reservations_created, sender=Reservation)
+def reservations_bulk_created(sender, reservations: List[Reservation], **kwargs):
+    for site_pk in {reservation.site_inventory.site_id for reservation in reservations}:
+        bump_site_version(site_pk)
+
+
+@receiver(pre_save, sender=Reservation)
+def reservation_saving(sender, instance: Reservation, **kwargs):
+    # Remember what the ledger currently holds for this reservation, so edits can be moved across
+    instance._ledger_previous = None
+    if instance.pk is not None:
+        instance._ledger_previous = Reservation.objects.filter(pk=instance.pk) \
+            .values_list('site_inventory_id', 'date', 'period_id', 'units').first()
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance: Reservation, created: bool, **kwargs):
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous is not None:
+        remove_reserved_units(*previous)
+
+    add_reserved_units(instance.site_inventory_id, instance.date, instance.period_id, instance.units)
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance: Reservation, **kwargs):
+    remove_reserved_units(instance.site_inventory_id, instance.date, instance.period_id, instance.units)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def reservation_movements_changed(sender, instance: Reservation, **kwargs):
+    item_days = [(instance.site_inventory_id, instance.date)]
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous is not None:
+        item_days.append((previous[0], previous[1]))
+
+    invalidate_movement_plans(item_days)
+
+
+@receiver(reservations_created, sender=Reservation)
+def reservations_bulk_created_movements(sender, reservations: List[Reservation], **kwargs):
+    invalidate_movement_plans((reservation.site_inventory_id, reservation.date) for reservation in reservations)
+
+
+@receiver(post_save, sender=SiteInventory)
+def site_inventory_movements_changed(sender, instance: SiteInventory, **kwargs):
+    # Units or the storage location may have changed
+    MovementPlan.objects.filter(site_inventory=instance).delete()
+
+
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+def movement_periods_changed(sender, instance: Period, **kwargs):
+    MovementPlan.objects.all().delete()
+
+
+@receiver(post_save, sender=SiteInventory)
+@receiver(post_delete, sender=SiteInventory)
+@receiver(post_save, sender=Week)
+@receiver(post_delete, sender=Week)
+@receiver(post_save, sender=Classroom)
+@receiver(post_delete, sender=Classroom)
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def site_data_changed(sender, instance, **kwargs):
+    bump_site_version(instance.site_id)
+
+
+@receiver(m2m_changed, sender=Team.members.through)
+def team_members_changed(sender, instance, action: str, **kwargs):
+    if action.startswith('post_') and isinstance(instance, Team):
+        bump_site_version(instance.site_id)
+
+
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+@receiver(post_save, sender=InventoryItem)
+@receiver(post_delete, sender=InventoryItem)
+@receiver(post_save, sender=TechnologyCategory)
+@receiver(post_delete, sender=TechnologyCategory)
+def shared_data_changed(sender, instance, **kwargs):
+    bump_all_site_versions()
+
+
+@receiver(post_save, sender=Period)
+@receiver(post_delete, sender=Period)
+@receiver(post_save, sender=Site)
+@receiver(post_delete, sender=Site)
+@receiver(post_save, sender=TechnologyCategory)
+@receiver(post_delete, sender=TechnologyCategory)
+@receiver(post_save, sender=UsagePurpose)
+@receiver(post_delete, sender=UsagePurpose)
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def reference_data_changed(sender, instance, **kwargs):
+    invalidate_reference_data()
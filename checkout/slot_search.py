@@ -0,0 +1,71 @@
+import datetime
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from checkout.models import *
+from checkout.reference_data import get_periods
+
+
+class AvailableSlot:
+    def __init__(self, slot_date: datetime.date, period: Period, free_units: int, item: SiteInventory):
+        self.date: datetime.date = slot_date
+        self.period: Period = period
+        self.free_units: int = free_units
+        self.item: SiteInventory = item
+
+    def __str__(self):
+        return "{} {} - {} free ({})".format(self.date, self.period, self.free_units, self.item.inventory.display_name)
+
+
+def find_available_slots(site: Site, category: TechnologyCategory, units: int, start_date: datetime.date,
+                         periods: Optional[List[Period]] = None, weekdays: Optional[Iterable[int]] = None,
+                         limit: int = 10, split: bool = False) -> List[AvailableSlot]:
+    """
+    Returns the earliest (date, period) slots, up to limit, in which units of the category can still be booked on a
+    single item - or across all of the category's items if split is set. Only the site's configured working days
+    from start_date onwards are searched, optionally restricted to some periods and weekdays (0 is Monday). The
+    search reads the reserved units ledger one week at a time and stops as soon as enough slots are found, so it
+    never builds a schedule and costs a few queries per week searched.
+    """
+    items: List[SiteInventory] = list(site.siteinventory_set.filter(inventory__type=category)
+                                      .select_related('inventory').order_by('pk'))
+    if len(items) == 0 or limit < 1:
+        return []
+
+    periods = sorted(periods) if periods is not None else get_periods()
+    weekdays = set(weekdays) if weekdays is not None else None
+
+    week_days: Dict[int, List[datetime.date]] = OrderedDict()
+    for week_pk, working_day in WeekDay.objects.filter(site=site, date__gte=start_date) \
+            .order_by('date', 'week_id').values_list('week_id', 'date'):
+        if weekdays is None or working_day.weekday() in weekdays:
+            week_days.setdefault(week_pk, [])
+            if working_day not in week_days[week_pk]:
+                week_days[week_pk].append(working_day)
+
+    slots: List[AvailableSlot] = []
+    searched_days = set()
+    for days in week_days.values():
+        days = [day for day in days if day not in searched_days]
+        searched_days.update(days)
+        if len(days) == 0:
+            continue
+
+        reserved: Dict[Tuple[int, datetime.date, int], int] = {
+            (site_inventory_id, entry_date, period_id): reserved_units for
+            site_inventory_id, entry_date, period_id, reserved_units in ReservedUnits.objects
+            .filter(site_inventory__in=items, date__in=days, period__in=periods)
+            .values_list('site_inventory_id', 'date', 'period_id', 'units')}
+
+        for day in days:
+            for period in periods:
+                free = [max(0, item.units - reserved.get((item.pk, day, period.pk), 0)) for item in items]
+                most_free = max(free)
+                free_units = sum(free) if split else most_free
+                if free_units >= units:
+                    slots.append(AvailableSlot(day, period, free_units, items[free.index(most_free)]))
+                    if len(slots) == limit:
+                        return slots
+
+    return slots
@@ -1,3 +1,619 @@
-from django.test import TestCase
+import csv
+import json
+import tempfile
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from checkout.allocation import Allocation, AvailabilityMatrix, allocate_units
+from checkout.archive import archive_batch, drop_archived_ledger
+from checkout.availability import InsufficientUnits, claim_slots, find_ledger_drift, get_reserved_units
+from checkout.export_jobs import claim_export_job, run_export_job
+from checkout.management.commands.benchmark_movement_planner import check_plan
+from checkout.models import *
+from checkout.movement_schedule import Movement, get_movement_schedules, plan_item_greedy, plan_item_optimal, \
+    solve_transportation
+from checkout.reservation_schedule import get_week_schedule
+from checkout.schedule_cache import bump_site_version, get_cached_grid, get_grid_cache_stats, get_site_version
+from checkout.views import resolve_week
+
+
+class CheckoutTestCase(TestCase):
+    """
+    A site with one configured week, three items, four classrooms and a team, with the team's only member logged in.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.site = Site.objects.create(name='Test Site')
+        self.subject = Subject.objects.create(name=Subject.ACTIVITY_SUBJECT)
+        self.purpose = UsagePurpose.objects.create(purpose=UsagePurpose.OTHER_PURPOSE)
+        self.periods = [Period.objects.create(number=number, name='Period {}'.format(number)) for number in range(1, 5)]
+        category = TechnologyCategory.objects.create(name='Laptop')
+        self.items = []
+        for number in range(3):
+            inventory = InventoryItem.objects.create(type=category, model_identifier='Model {}'.format(number),
+                                                     display_name='Item{}'.format(number), units=1000)
+            self.items.append(SiteInventory.objects.create(site=self.site, inventory=inventory, units=1000))
+        self.classrooms = [Classroom.objects.create(site=self.site, name='Room {}'.format(number), code=str(number))
+                           for number in range(4)]
+
+        self.user = User.objects.create(email='teacher@example.com', name='Teacher', site=self.site)
+        self.user.set_password('password')
+        self.user.save()
+        self.team = Team.objects.create(site=self.site, subject=self.subject)
+        self.team.members.add(self.user)
+
+        self.start = date.today() - timedelta(days=date.today().weekday())
+        self.days = [self.start + timedelta(days=day) for day in range(5)]
+        Week.objects.create(site=self.site, week_number=1,
+                            pickled_days=json.dumps([day.isoformat() for day in self.days]))
+
+        self.client.login(email=self.user.email, password='password')
+        self.created = 0
+
+    def add_reservations(self, count: int, days: List[date] = None):
+        days = days or self.days
+        for _ in range(count):
+            number = self.created
+            Reservation.objects.create(
+                team=self.team, site_inventory=self.items[number % len(self.items)],
+                classroom=self.classrooms[(number // len(self.items)) % len(self.classrooms)],
+                date=days[number % len(days)], period=self.periods[(number // 12) % len(self.periods)],
+                units=1, purpose=self.purpose, collaborative=False, creator=self.user)
+            self.created += 1
+
+    def add_weeks(self, count: int):
+        for week_number in range(2, count + 2):
+            days = [day + timedelta(weeks=week_number - 1) for day in self.days]
+            Week.objects.create(site=self.site, week_number=week_number,
+                                pickled_days=json.dumps([day.isoformat() for day in days]))
+
+    def reserve(self, units: int, periods: List[Period], classroom: Classroom, request_date: date = None, **params):
+        return self.client.post('/reserve/', dict({
+            'request_date': (request_date or self.days[0]).isoformat(), 'site_inventory': self.items[0].pk,
+            'team': self.team.pk, 'purpose': self.purpose.pk, 'request_units': units, 'comment': '',
+            'classroom': classroom.pk,
+        }, **{'period_{}'.format(period.pk): 'on' for period in periods}, **params))
+
+    def get_messages(self, response) -> List[str]:
+        return [str(message) for message in get_messages(response.wsgi_request)]
+
+
+class QueryCountTests(CheckoutTestCase):
+    """
+    Adding reservations must not add queries to the pages that list them.
+    """
+
+    def count_queries(self, url: str) -> int:
+        cache.clear()  # Count the queries that build the schedule, not a cache hit
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url: str, days: List[date] = None):
+        self.add_reservations(3, days)
+        self.client.get(url)  # Loads the reference data cache
+        few = self.count_queries(url)
+        self.add_reservations(40, days)
+        many = self.count_queries(url)
+        self.assertEqual(few, many, "{} took {} queries with 3 reservations but {} with 43".format(url, few, many))
+
+    def test_week_schedule(self):
+        self.assertConstantQueries('/week/1')
+
+    def test_week_movements(self):
+        def count_stored_and_planned():
+            self.client.get('/movements/1')  # Stores the plans
+            stored = self.count_queries('/movements/1')
+            MovementPlan.objects.all().delete()
+            return stored, self.count_queries('/movements/1')
+
+        self.add_reservations(3)
+        few = count_stored_and_planned()
+        self.add_reservations(40)
+        many = count_stored_and_planned()
+        self.assertEqual(few, many, "/movements/1 took {} queries (from stored plans, planned) with 3 reservations "
+                                    "but {} with 43".format(few, many))
+
+    def test_reservations(self):
+        past_days = [day - timedelta(days=7) for day in self.days]
+        self.add_reservations(5, past_days)
+        self.assertConstantQueries('/reservations/')
+
+    def test_reservation_request(self):
+        self.assertConstantQueries('/request/?site_inventory={}&date={}&period={}'.format(
+            self.items[0].pk, self.days[0].isoformat(), self.periods[0].pk))
+
+    def test_reservation_details(self):
+        self.add_reservations(1)
+        reservation = Reservation.objects.first()
+        self.client.get('/reservation/{}'.format(reservation.pk))  # Loads the reference data cache
+        few = self.count_queries('/reservation/{}'.format(reservation.pk))
+        self.team.members.add(*[User.objects.create(email='member{}@example.com'.format(number),
+                                                    name='Member {}'.format(number), site=self.site)
+                                for number in range(5)])
+        self.assertEqual(few, self.count_queries('/reservation/{}'.format(reservation.pk)))
+
+
+class ScheduleCacheTests(CheckoutTestCase):
+    def test_grid_cached_per_site_version(self):
+        week = Week.objects.get(site=self.site, week_number=1)
+        builds: List[int] = []
+
+        def build_grid() -> int:
+            builds.append(len(builds) + 1)
+            return builds[-1]
+
+        def get_grid() -> int:
+            return get_cached_grid('schedule', self.site, week, build_grid)
+
+        self.assertEqual(get_grid(), 1)
+        self.assertEqual(get_grid(), 1)
+
+        bump_site_version(self.site.pk)
+        self.assertEqual(get_grid(), 2)
+
+        # Reservations bump the version of their site
+        self.add_reservations(1)
+        self.assertEqual(get_grid(), 3)
+        self.assertEqual(get_grid(), 3)
+        self.assertEqual(len(builds), 3)
+        self.assertEqual(get_grid_cache_stats(), (2, 3))
+
+
+class ConditionalGetTests(CheckoutTestCase):
+    def test_schedule_not_modified(self):
+        self.client.get('/week/1')  # Sets the CSRF cookie, which is part of the ETag
+        etag = self.client.get('/week/1')['ETag']
+
+        with mock.patch('checkout.views.get_week_schedule') as build_schedule:
+            response = self.client.get('/week/1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        build_schedule.assert_not_called()
+
+        self.add_reservations(1)
+        response = self.client.get('/week/1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        created_etag = response['ETag']
+        self.assertNotEqual(created_etag, etag)
+
+        Reservation.objects.get().delete()
+        response = self.client.get('/week/1', HTTP_IF_NONE_MATCH=created_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(response['ETag'], (etag, created_etag))
+
+
+class WeekTests(CheckoutTestCase):
+    def move_week(self, week: Week, weeks: int):
+        week.pickled_days = json.dumps([(day + timedelta(weeks=weeks)).isoformat() for day in week.days()])
+        week.save()
+
+    def test_day_range_follows_days(self):
+        week = Week.objects.get(site=self.site, week_number=1)
+        self.assertEqual((week.first_day, week.last_day), (self.days[0], self.days[-1]))
+
+        week.pickled_days = json.dumps([day.isoformat() for day in reversed(self.days[1:4])])
+        week.save()
+        week = Week.objects.get(pk=week.pk)
+        self.assertEqual((week.first_day, week.last_day), (self.days[1], self.days[3]))
+        self.assertEqual(sorted(week.weekday_set.values_list('date', flat=True)), self.days[1:4])
+
+    def test_resolve_week(self):
+        self.add_weeks(2)
+        weeks = {week.week_number: week for week in Week.objects.filter(site=self.site)}
+        # Including the weekend, so that it contains today on any day
+        weeks[1].pickled_days = json.dumps([(self.start + timedelta(days=day)).isoformat() for day in range(7)])
+        weeks[1].save()
+
+        # The week containing today
+        self.assertEqual(resolve_week(self.user).week_number, 1)
+
+        # Otherwise the first of the weeks still to come
+        self.move_week(weeks[1], -4)
+        self.move_week(weeks[3], 4)
+        self.assertEqual(resolve_week(self.user).week_number, 2)
+
+        # Otherwise the last week
+        self.move_week(weeks[2], -4)
+        self.move_week(weeks[3], -8)
+        self.assertEqual(resolve_week(self.user).week_number, 3)
+
+
+class WeekAvailabilityTests(CheckoutTestCase):
+    def test_matches_week_schedule(self):
+        self.add_reservations(20)
+        response = self.client.get('/week/1/availability')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode())
+
+        category = self.items[0].inventory.type
+        schedule = get_week_schedule(self.site, self.days)
+        self.assertEqual(data['days'], [day.isoformat() for day in self.days])
+        self.assertEqual(data['categories'], [[category.pk, category.name]])
+        self.assertEqual(data['free'], [[[period_info.free[category]] for period_info in day_schedule.periods]
+                                        for day_schedule in schedule])
+        self.assertEqual(data['free'][0][0], [3000 - sum(Reservation.objects.filter(
+            date=self.days[0], period=self.periods[0]).values_list('units', flat=True))])
+        self.assertEqual(sorted(data['reservations']), sorted(
+            [reservation.pk, self.days.index(reservation.date), reservation.period_id, reservation.site_inventory_id,
+             reservation.classroom_id, reservation.units] for reservation in Reservation.objects.all()))
+
+        response = self.client.get('/week/1/availability', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class ReservationDetailsTests(CheckoutTestCase):
+    def test_other_site_not_found(self):
+        self.add_reservations(1)
+        reservation = Reservation.objects.first()
+        self.assertEqual(self.client.get('/reservation/{}'.format(reservation.pk)).status_code, 200)
+
+        other_site = Site.objects.create(name='Other Site')
+        other_user = User.objects.create(email='other@example.com', name='Other', site=other_site)
+        other_user.set_password('password')
+        other_user.save()
+        self.client.login(email=other_user.email, password='password')
+        self.assertEqual(self.client.get('/reservation/{}'.format(reservation.pk)).status_code, 404)
+
+        other_user.is_superuser = True
+        other_user.save()
+        self.assertEqual(self.client.get('/reservation/{}'.format(reservation.pk)).status_code, 200)
+
+
+class LedgerTests(CheckoutTestCase):
+    def test_claim_rejected_when_full(self):
+        self.items[0].units = 5
+        self.items[0].save()
+
+        self.reserve(5, self.periods[:2], self.classrooms[0])
+        self.assertEqual(Reservation.objects.count(), 2)
+
+        # Period 3 has room but period 2 doesn't, so nothing is booked or claimed
+        self.reserve(1, self.periods[1:3], self.classrooms[1])
+        self.assertEqual(Reservation.objects.count(), 2)
+        self.assertEqual(get_reserved_units([self.items[0]], self.days[0]), {
+            (self.items[0].pk, self.days[0], self.periods[0].pk): 5,
+            (self.items[0].pk, self.days[0], self.periods[1].pk): 5,
+        })
+        self.assertEqual(find_ledger_drift(), {})
+
+        with self.assertRaises(InsufficientUnits):
+            with transaction.atomic():
+                claim_slots(self.items[0], [(self.days[0], self.periods[1])], 1)
+
+    def test_ledger_follows_reservations(self):
+        self.add_reservations(30)
+        self.assertEqual(find_ledger_drift(), {})
+        self.assertEqual(sum(get_reserved_units(self.items, self.days[0]).values()),
+                         Reservation.objects.filter(date=self.days[0]).count())
+
+        reservation = Reservation.objects.order_by('pk').first()
+        reservation.units = 7
+        reservation.save()
+        self.assertEqual(find_ledger_drift(), {})
+
+        reservation.period = self.periods[-1]
+        reservation.date = self.days[-1]
+        reservation.site_inventory = self.items[-1]
+        reservation.save()
+        self.assertEqual(find_ledger_drift(), {})
+
+        Reservation.objects.filter(pk__in=list(Reservation.objects.order_by('-pk').values_list('pk', flat=True)[:5])) \
+            .delete()
+        self.assertEqual(find_ledger_drift(), {})
+
+        deleted_item_pk = self.items[1].pk
+        self.items[1].delete()
+        self.assertEqual(find_ledger_drift(), {})
+        self.assertFalse(ReservedUnits.objects.filter(site_inventory_id=deleted_item_pk).exists())
+
+
+class BatchReservationTests(CheckoutTestCase):
+    def setUp(self):
+        super(BatchReservationTests, self).setUp()
+        self.items[0].units = 5
+        self.items[0].save()
+        self.reserve(2, self.periods[1:2], self.classrooms[0])
+        self.reserved = self.get_state()
+
+    def get_state(self):
+        return list(Reservation.objects.order_by('pk').values_list('pk', 'period_id', 'units')), \
+            get_reserved_units([self.items[0]], self.days[0])
+
+    def test_conflicting_period(self):
+        response = self.reserve(1, self.periods[:3], self.classrooms[0])
+        self.assertIn("Failed to make reservation - another reservation by this team for Item0 in Room 0 during "
+                      "Period 2 already exists. Please delete the existing reservation and try again",
+                      self.get_messages(response))
+        self.assertEqual(self.get_state(), self.reserved)
+
+    def test_full_period(self):
+        response = self.reserve(4, self.periods[:3], self.classrooms[1])
+        self.assertIn("Cannot reserve 4 units of Item0 in Period 2, only 3 are available",
+                      self.get_messages(response))
+        self.assertEqual(self.get_state(), self.reserved)
+        self.assertEqual(find_ledger_drift(), {})
+
+
+class RecurringReservationTests(CheckoutTestCase):
+    def test_full_slots_skipped(self):
+        self.add_weeks(2)
+        self.items[0].units = 5
+        self.items[0].save()
+        full_day = self.days[0] + timedelta(weeks=1)
+        self.reserve(5, self.periods[:1], self.classrooms[0], full_day)
+
+        response = self.reserve(2, self.periods[:2], self.classrooms[1], repeat_until=3)
+        self.assertEqual(sorted(Reservation.objects.filter(classroom=self.classrooms[1])
+                                .values_list('date', 'period_id')), sorted(
+            (self.days[0] + timedelta(weeks=week), period.pk) for week in range(3) for period in self.periods[:2]
+            if (week, period) != (1, self.periods[0])))
+        self.assertIn("Could not reserve 2 unit(s) of Item0 on: {} Period 1 (only 0 available)".format(
+            full_day.strftime("%a, %b %d")), self.get_messages(response))
+        self.assertEqual(find_ledger_drift(), {})
+
+    def test_invalid_repeat_until(self):
+        response = self.reserve(1, self.periods[:1], self.classrooms[0], repeat_until='next week')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("Repeat until must be set to a valid week number", self.get_messages(response))
+        self.assertFalse(Reservation.objects.exists())
+
+
+class AllocationTests(SimpleTestCase):
+    def setUp(self):
+        self.periods = [Period(pk=number, number=number, name='Period {}'.format(number)) for number in range(1, 3)]
+
+    def make_matrix(self, free: List[List[int]]) -> AvailabilityMatrix:
+        items = [SiteInventory(pk=pk, units=max(row)) for pk, row in enumerate(free, 1)]
+        return AvailabilityMatrix(items, self.periods, free)
+
+    def assertAllocation(self, allocation: Allocation, expected: List[Tuple[int, int]]):
+        self.assertEqual([(item.pk, units) for item, units in allocation], expected)
+
+    def test_exact_fit(self):
+        matrix = self.make_matrix([[5, 5], [10, 12], [3, 3]])
+        self.assertAllocation(allocate_units(matrix, self.periods, 10), [(2, 10)])
+        self.assertAllocation(allocate_units(matrix, self.periods, 5, matrix.items[0]), [(1, 5)])
+
+    def test_split_across_items(self):
+        matrix = self.make_matrix([[5, 5], [10, 12], [3, 3]])
+        # The largest item is used up, and the rest goes to the smallest item it fits in
+        self.assertAllocation(allocate_units(matrix, self.periods, 14), [(2, 10), (1, 4)])
+        self.assertAllocation(allocate_units(matrix, self.periods, 12, matrix.items[0]), [(2, 10), (3, 2)])
+        # Only units free in every requested period count
+        self.assertAllocation(allocate_units(matrix, self.periods[1:], 14), [(2, 12), (3, 2)])
+
+    def test_insufficient_units(self):
+        matrix = self.make_matrix([[5, 5], [10, 12], [3, 0]])
+        self.assertIsNone(allocate_units(matrix, self.periods, 16))
+        self.assertAllocation(allocate_units(matrix, self.periods[:1], 16), [(2, 10), (1, 5), (3, 1)])
+
+    def test_ties_go_to_the_first_item(self):
+        matrix = self.make_matrix([[4, 4], [4, 4], [4, 4]])
+        self.assertAllocation(allocate_units(matrix, self.periods, 4), [(1, 4)])
+        self.assertAllocation(allocate_units(matrix, self.periods, 6), [(1, 4), (2, 2)])
+
+
+class SlotSearchTests(CheckoutTestCase):
+    def assertRejected(self, params: dict):
+        response = self.client.get('/slots/', params)
+        self.assertRedirects(response, '/slots/', fetch_redirect_response=False)
+
+    def test_invalid_search(self):
+        category = self.items[0].inventory.type
+        self.assertRejected({'category': category.pk})
+        self.assertRejected({'category': category.pk, 'units': 'many'})
+        self.assertRejected({'category': category.pk, 'units': 0})
+        self.assertRejected({'category': category.pk, 'units': 3001})
+        self.assertRejected({'category': category.pk, 'units': 1, 'weekday': 7})
+
+    def test_limit_clamped(self):
+        self.add_weeks(3)
+        category = self.items[0].inventory.type
+        response = self.client.get('/slots/', {'category': category.pk, 'units': 1, 'limit': 1000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['slots']), 50)
+
+
+class MovementPlannerTests(SimpleTestCase):
+    def setUp(self):
+        self.periods = [Period(pk=number, number=number, name='Period {}'.format(number)) for number in range(1, 5)]
+        self.storage_location = Classroom(pk=0, name='Storage')
+        self.classrooms = [Classroom(pk=number, name='Room {}'.format(number)) for number in range(1, 3)]
+        self.item = SiteInventory(pk=1, units=10, storage_location='Storage')
+
+    def assertTransportation(self, supply: List[int], demand: List[int], cost: List[List[int]],
+                             expected: List[List[int]]):
+        flows = solve_transportation(supply, demand, cost)
+        self.assertEqual([sum(row) for row in flows], supply)
+        self.assertEqual([sum(column) for column in zip(*flows)], demand)
+        self.assertEqual(flows, expected)
+
+    def test_transportation(self):
+        # Sending 2 from the first source to the first destination and the rest straight across costs 8, the least
+        self.assertTransportation([3, 2], [2, 3], [[1, 4], [2, 1]], [[2, 1], [0, 2]])
+        # Straight across costs 11 and crossing over 3, which takes undoing part of a cheaper path found first
+        self.assertTransportation([1, 1], [1, 1], [[1, 2], [1, 10]], [[0, 1], [1, 0]])
+
+    def plan(self, planner: Callable, period_reservations: List[List[Reservation]]) -> int:
+        """
+        Plans the item with the planner, checks that the plan serves every reservation, and returns the units it
+        moves.
+        """
+        movements: Dict[Period, List[Movement]] = {period: [] for period in self.periods}
+        planner(self.item, self.storage_location, self.periods, period_reservations, movements)
+        check_plan(self.item, self.storage_location, self.periods, period_reservations, movements)
+        return sum(movement.units for period_movements in movements.values() for movement in period_movements)
+
+    def test_optimal_keeps_units_needed_later(self):
+        room = self.classrooms[0]
+        # Room 1 needs 5 units, then none, then 5 again before everything goes back to storage
+        period_reservations = [[Reservation(classroom=room, units=5)], [], [Reservation(classroom=room, units=5)], []]
+        self.assertEqual(self.plan(plan_item_greedy, period_reservations), 20)
+        self.assertEqual(self.plan(plan_item_optimal, period_reservations), 10)
+
+    def test_optimal_never_moves_more(self):
+        first, second = self.classrooms
+        cases = [
+            [[Reservation(classroom=first, units=5)], [Reservation(classroom=second, units=5)],
+             [Reservation(classroom=first, units=5)], []],
+            [[Reservation(classroom=first, units=6), Reservation(classroom=second, units=4)],
+             [Reservation(classroom=first, units=4), Reservation(classroom=second, units=6)],
+             [Reservation(classroom=second, units=10)], []],
+            # More than the item has: both serve the largest reservations first
+            [[Reservation(classroom=first, units=8), Reservation(classroom=second, units=8)], [], [], []],
+        ]
+        # The reservations aren't complete enough to describe in the warnings about the ones that can't be served
+        with mock.patch('checkout.movement_schedule.logger'):
+            for period_reservations in cases:
+                self.assertLessEqual(self.plan(plan_item_optimal, period_reservations),
+                                     self.plan(plan_item_greedy, period_reservations))
+
+
+class MovementPlanTests(CheckoutTestCase):
+    def test_movement_plans_invalidated(self):
+        self.add_reservations(6)
+        self.client.get('/movements/1')
+        self.assertEqual(MovementPlan.objects.count(), len(self.items) * len(self.days))
+
+        reservation = Reservation.objects.get(site_inventory=self.items[0], date=self.days[0])
+        reservation.units = 5
+        reservation.save()
+        self.assertFalse(MovementPlan.objects.filter(site_inventory=self.items[0], date=self.days[0]).exists())
+        self.assertEqual(MovementPlan.objects.count(), len(self.items) * len(self.days) - 1)
+
+    def test_planner_switched(self):
+        self.add_reservations(6)
+        self.client.get('/movements/1')
+        self.assertEqual(MovementPlan.objects.filter(planner='greedy').count(), len(self.items) * len(self.days))
+
+        cache.clear()  # Rendered grids are cached per site version, not per planner
+        with mock.patch('checkout.movement_schedule.MOVEMENT_PLANNER', 'optimal'):
+            self.client.get('/movements/1')
+        self.assertEqual(MovementPlan.objects.filter(planner='optimal').count(), len(self.items) * len(self.days))
+        self.assertEqual(MovementPlan.objects.filter(planner='greedy').count(), len(self.items) * len(self.days))
+
+
+    def test_reservation_committed_while_planning(self):
+        self.add_reservations(6)
+        versions: List[int] = []
+
+        def get_site_version_then_reserve(site: Site) -> DataVersion:
+            data_version = get_site_version(site)
+            versions.append(data_version.version)
+            if len(versions) == 2:
+                # Commits after the plans were checked against the site version, but before they are stored
+                self.add_reservations(1)
+            return data_version
+
+        with mock.patch('checkout.movement_schedule.get_site_version', get_site_version_then_reserve):
+            get_movement_schedules(self.site, self.days)
+        self.assertEqual(len(versions), 3)
+        self.assertFalse(MovementPlan.objects.exists())
+
+        def describe(schedules) -> List[List[str]]:
+            return [[str(period) for period in schedule.periods] for schedule in schedules]
+
+        # Planned again from the new reservation, and stored
+        self.assertEqual(describe(get_movement_schedules(self.site, self.days)),
+                         describe(get_movement_schedules(self.site, self.days, use_stored_plans=False)))
+        self.assertEqual(MovementPlan.objects.count(), len(self.items) * len(self.days))
+
+
+class DistrictReportTests(CheckoutTestCase):
+    def test_report_rows(self):
+        self.user.is_superuser = True
+        self.user.save()
+        self.add_reservations(1)
+
+        response = self.client.get('/district_movements/', {'start': self.days[0].isoformat(), 'format': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        day = self.days[0].isoformat()
+        storage = self.items[0].storage_location
+        self.assertEqual(rows, [
+            ['Site', 'Date', 'Period', 'Item', 'Units', 'From', 'To', 'Comment'],
+            ['Test Site', day, 'Before Period 1', 'Item0', '1', storage, 'Room 0', ''],
+            ['Test Site', day, 'Before Period 2', 'Item0', '1', 'Room 0', storage, ''],
+        ])
+        # Planned in this process, and stored for the movements page and the next report
+        self.assertEqual(MovementPlan.objects.filter(date=self.days[0]).count(), len(self.items))
+
+
+class ArchiveTests(CheckoutTestCase):
+    def test_archive_in_batches(self):
+        past_days = [day - timedelta(weeks=2) for day in self.days]
+        self.add_reservations(10, past_days)
+        self.add_reservations(5)
+        archived = list(Reservation.objects.filter(date__lt=self.start).order_by('pk')
+                        .values_list('pk', 'units', 'created', 'modified'))
+        version = get_site_version(self.site).version
+
+        self.assertEqual([archive_batch(self.start, 4) for _ in range(4)], [4, 4, 2, 0])
+        self.assertEqual(list(ArchivedReservation.objects.order_by('pk')
+                              .values_list('pk', 'units', 'created', 'modified')), archived)
+        self.assertEqual(Reservation.objects.count(), 5)
+        self.assertEqual(find_ledger_drift(), {})
+        self.assertGreater(get_site_version(self.site).version, version)
+
+        self.assertEqual(drop_archived_ledger(self.start), len({
+            (reservation.site_inventory_id, reservation.date, reservation.period_id)
+            for reservation in ArchivedReservation.objects.all()}))
+        self.assertFalse(ReservedUnits.objects.filter(date__lt=self.start).exists())
+
+        # Archived reservations are still listed as past reservations
+        response = self.client.get('/reservations/')
+        past_pks = {reservation.pk for reservation in response.context['past_reservations']}
+        self.assertTrue({pk for pk, _, _, _ in archived} <= past_pks)
+
+
+class ExportTests(CheckoutTestCase):
+    def setUp(self):
+        super(ExportTests, self).setUp()
+        self.user.is_superuser = True
+        self.user.save()
+
+    def test_export_pages(self):
+        self.add_reservations(10)
+
+        def get_export(params: dict) -> Tuple[List[str], Optional[str]]:
+            response = self.client.get('/export/', params)
+            self.assertEqual(response.status_code, 200)
+            return b''.join(response.streaming_content).decode().splitlines()[1:], response.get('X-Export-Cursor')
+
+        rows, _ = get_export({})
+        paged_rows, cursor = get_export({'page_size': 3})
+        while cursor is not None:
+            page, cursor = get_export({'cursor': cursor})
+            paged_rows += page
+        self.assertEqual(sorted(rows), sorted(paged_rows))
+
+        modified_since = datetime.now()
+        reservation = Reservation.objects.first()
+        reservation.save()
+        rows, _ = get_export({'modified_since': modified_since.isoformat()})
+        self.assertEqual(len(rows), 1)
+
+    def test_export_job(self):
+        self.add_reservations(10)
+        expected = b''.join(self.client.get('/export/').streaming_content)
+
+        with tempfile.TemporaryDirectory() as export_root, mock.patch('checkout.export_jobs.EXPORT_ROOT', export_root):
+            self.client.post('/export/', {'format': ExportJob.CSV})
+            job = claim_export_job()
+            self.assertIsNone(claim_export_job())
+            run_export_job(job)
+
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.rows_written), (ExportJob.DONE, 10))
+            response = self.client.get('/export/jobs/{}'.format(job.pk))
+            self.assertEqual(b''.join(response.streaming_content), expected)
+            response.close()
@@ -1,22 +1,114 @@
+import calendar
+import hashlib
 import logging
-from typing import Dict
+from typing import Callable, Dict, Optional, Tuple
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.db import transaction, IntegrityError
-from django.http import HttpResponseNotFound, HttpResponseBadRequest, StreamingHttpResponse
+from django.db.models import Q, Sum
+from django.http import Http404, HttpResponseNotFound, HttpResponseBadRequest, StreamingHttpResponse, JsonResponse, \
+    FileResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.views.decorators.http import condition
 
+from checkout.allocation import AvailabilityMatrix, Allocation, get_availability_matrix, pick_item, allocate_units
+from checkout.availability import claim_slots, claim_available_slots, InsufficientUnits, Slot
 from checkout.models import *
-from checkout.movement_schedule import MovementSchedule, get_movement_periods
-from checkout.reservation_schedule import ReservationSchedule
+from checkout.district_report import get_district_movement_rows, district_report_csv, district_report_html
+from checkout.export import EXPORT_MAX_PAGE_SIZE, get_export_filters, get_export_querysets, get_export_page, \
+    dump_export_cursor, load_export_cursor, export_rows, export_csv
+from checkout.export_jobs import enqueue_export_job, get_export_path
+from checkout.identity_map import IdentityMap, get_identity_map
+from checkout.movement_schedule import MovementSchedule, get_movement_periods, get_movement_schedules
+from checkout.reference_data import get_periods, get_period, get_sites, get_categories, get_category, get_purposes
+from checkout.recurrence import get_recurrence_dates, parse_dates
+from checkout.reservation_schedule import ReservationSchedule, get_week_schedule
+from checkout.schedule_cache import get_cached_grid, get_site_version, get_site_versions
+from checkout.schedule_grid import ScheduleGrid
+from checkout.signals import reservations_created
+from checkout.slot_search import find_available_slots
 from techtracking.error_utils import error_redirect, success_redirect, require_http_post
 
 logger = logging.getLogger(__name__)
 
 
+def site_versions(request) -> List[DataVersion]:
+    return [get_site_version(request.user.site)]
+
+
+def team_site_versions(request) -> List[DataVersion]:
+    user: User = request.user
+    site_pks: List[str] = list(Team.objects.filter(members=user).values_list('site_id', flat=True))
+    return get_site_versions(site_pks + [user.site_id])
+
+
+def get_page_versions(request, get_versions: Callable) -> Optional[List[DataVersion]]:
+    """
+    Returns the data versions a page was rendered from, or None if the page must be rendered regardless (e.g.
+    because there are messages waiting to be shown). Looked up once per request for both validators.
+    """
+    if not hasattr(request, '_page_versions'):
+        if len(messages.get_messages(request)) > 0:
+            request._page_versions = None
+        else:
+            request._page_versions = get_versions(request)
+
+    return request._page_versions
+
+
+def page_etag(get_versions: Callable) -> Callable:
+    def etag(request, *args, **kwargs) -> Optional[str]:
+        versions: List[DataVersion] = get_page_versions(request, get_versions)
+        if versions is None:
+            return None
+
+        user: User = request.user
+        parts = [request.get_full_path(), user.email, user.site_id, user.is_staff, user.is_superuser,
+                 request.META.get('CSRF_COOKIE', ''), datetime.now().date().isoformat()]
+        parts += ["{}={}".format(version.key, version.version) for version in sorted(versions, key=lambda v: v.key)]
+        return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    return etag
+
+
+def page_last_modified(get_versions: Callable) -> Callable:
+    def last_modified(request, *args, **kwargs) -> Optional[datetime]:
+        versions: List[DataVersion] = get_page_versions(request, get_versions)
+        if versions is None:
+            return None
+
+        # Pages depend on the current date (e.g. which week is shown, past vs. upcoming reservations)
+        timestamps = [datetime.combine(datetime.now().date(), datetime.min.time())]
+        timestamps += [version.modified for version in versions]
+        if request.user.last_login:
+            timestamps.append(request.user.last_login)
+
+        return max(timestamps)
+
+    return last_modified
+
+
+def data_etag(get_versions: Callable) -> Callable:
+    def etag(request, *args, **kwargs) -> str:
+        parts = [request.path, request.user.site_id]
+        parts += ["{}={}".format(version.key, version.version) for version in
+                  sorted(get_versions(request), key=lambda v: v.key)]
+        return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+    return etag
+
+
+def data_last_modified(get_versions: Callable) -> Callable:
+    def last_modified(request, *args, **kwargs) -> datetime:
+        return max(version.modified for version in get_versions(request))
+
+    return last_modified
+
+
 @login_required
+@condition(etag_func=page_etag(site_versions), last_modified_func=page_last_modified(site_versions))
 def index(request):
     user: User = request.user
     site: Site = user.site
@@ -36,34 +128,24 @@ def index(request):
 
 
 def resolve_week(user: User):
-    weeks: List[Week] = sorted(list(user.site.week_set.all()))
-
-    if len(weeks) < 1:
-        return None
-
+    weeks = user.site.week_set
     today = datetime.now().date()
 
-    if today < weeks[0].start_date():
-        return weeks[0]
-
-    if today > weeks[-1].end_date():
-        return weeks[-1]
-
-    current_week: Week = weeks[0]
-
-    for week in weeks:
-        if week.start_date() <= today <= week.end_date():
-            current_week = week
-            break
-        if today <= week.start_date():
-            current_week = week
-            break
+    # The week containing today, otherwise the next upcoming week, otherwise the last week
+    current_week: Week = weeks.filter(first_day__lte=today, last_day__gte=today).order_by('week_number').first()
+    if current_week is None:
+        current_week = weeks.filter(first_day__gt=today).order_by('week_number').first()
+    if current_week is None:
+        current_week = weeks.order_by('-week_number').first()
+    if current_week is None:
+        return None
 
     logger.info("[%s] Resolved current week for %s to be %s", user.email, user.site, current_week.week_number)
     return current_week
 
 
 @login_required
+@condition(etag_func=page_etag(site_versions), last_modified_func=page_last_modified(site_versions))
 def week_schedule(request, week_number):
     user: User = request.user
     site: Site = user.site
@@ -81,11 +163,12 @@ def week_schedule(request, week_number):
 def render_schedule(request, week: Week):
     site: Site = request.user.site
 
-    working_days = sorted(list(week.days()))
+    calendar_days: List[date] = week.calendar_days()
 
-    schedule: List[ReservationSchedule] = []
-    for day in working_days:
-        schedule.append(ReservationSchedule(site, day))
+    def build_grid() -> ScheduleGrid:
+        working_days = sorted(list(week.days()))
+        schedule: List[ReservationSchedule] = get_week_schedule(site, working_days, get_identity_map(request))
+        return ScheduleGrid(get_periods(), calendar_days, schedule)
 
     previous_week = (site.week_set.filter(week_number=week.week_number - 1).first(),)
     next_week = (site.week_set.filter(week_number=week.week_number + 1).first(),)
@@ -96,64 +179,75 @@ def render_schedule(request, week: Week):
         next_week = (next_week[0], reverse('schedule', args=[next_week[0].week_number]))
 
     context = {
-        "sites": Site.objects.all(),
+        "sites": get_sites(),
         "week": week,
         "previous_week": previous_week,
         "next_week": next_week,
-        "calendar_days": week.calendar_days(),
-        "periods": sorted(Period.objects.all()),
-        "schedule": schedule,
+        "calendar_days": calendar_days,
+        "grid": get_cached_grid('schedule', site, week, build_grid),
     }
 
     return render(request, "checkout/week_reservations.html", context)
 
 
-def get_available_inventory(site: Site, category: TechnologyCategory, request_date: date) -> \
-        Dict[SiteInventory, Dict[Period, int]]:
-    reservations: List[Reservation] = list(Reservation.objects.filter(
-        site_inventory__inventory__type=category, site_inventory__site=site, date=request_date))
-    category_inventory: List[SiteInventory] = list(site.siteinventory_set.filter(inventory__type=category))
-
-    free_units: Dict[SiteInventory, Dict[Period, int]] = {}
-    for inventory in category_inventory:
-        free_units[inventory] = {}
-        for period in sorted(Period.objects.all()):
-            free_units[inventory][period] = inventory.units
-
-    for existing_reservation in reservations:
-        free_units[existing_reservation.site_inventory][existing_reservation.period] = max(0, free_units[
-            existing_reservation.site_inventory][existing_reservation.period] - existing_reservation.units)
-
-    return free_units
-
-
-def pick_inventory(available: Dict[SiteInventory, Dict[Period, int]], selected_period: Period) -> SiteInventory:
+@login_required
+@condition(etag_func=data_etag(site_versions), last_modified_func=data_last_modified(site_versions))
+def week_availability(request, week_number):
     """
-    Heuristic to pick the 'best' available inventory item. The 'best' item is the one most likely to
-    satisfy the current request (keeping in mind that the requester may want to select several periods
-    after the current one), and the one least likely to go 'out of stock' (i.e. the one with most
-    availability) and prevent other users from reserving it.
+    Compact JSON version of the week schedule: free units per (day, period, category) plus a list of reservations.
+    Names are sent once in lookup tables and everything else refers to them by id.
     """
+    user: User = request.user
+    site: Site = user.site
 
-    best_item: SiteInventory = None
-    best_avg_availability: int = 0
-    for item, item_availability in available.items():
-        availability_sum = 0.0
-        availability_count = 0
-        for period, available_count in item_availability.items():
-            if period >= selected_period:
-                availability_sum += available_count
-                availability_count += 1
+    week: Week = site.week_set.filter(week_number=week_number).first()
+    if week is None:
+        logger.warning("[%s] Received request for nonexistent week %s at site %s", user.email, week_number, site)
+        return HttpResponseNotFound("Week %s was not found for %s" % (week_number, site.name))
 
-        item_avg_availability = availability_sum / availability_count
-        if item_avg_availability > best_avg_availability and available[item][selected_period] > 0:
-            best_avg_availability = item_avg_availability
-            best_item = item
+    working_days: List[date] = sorted(list(week.days()))
+    schedule: List[ReservationSchedule] = get_week_schedule(site, working_days, get_identity_map(request))
+
+    periods: List[Period] = [period_info.period for period_info in schedule[0].periods] if schedule else []
+    categories: List[TechnologyCategory] = []
+    items: Dict[int, List] = {}
+    classrooms: Dict[int, str] = {}
+    free: List[List[List[int]]] = []
+    reservation_rows: List[List] = []
+
+    for site_inventory in site.siteinventory_set.select_related('inventory__type').order_by('pk'):
+        if site_inventory.inventory.type not in categories:
+            categories.append(site_inventory.inventory.type)
+        items[site_inventory.pk] = [site_inventory.inventory.display_name, site_inventory.inventory.type_id,
+                                    site_inventory.units]
+
+    for day_index, day_schedule in enumerate(schedule):
+        day_free: List[List[int]] = []
+        for period_info in day_schedule.periods:
+            day_free.append([period_info.free.get(category, 0) for category in categories])
+            for reservation in period_info.reservations:
+                classrooms[reservation.classroom_id] = reservation.classroom.code
+                reservation_rows.append([reservation.pk, day_index, reservation.period_id,
+                                         reservation.site_inventory_id, reservation.classroom_id, reservation.units])
+        free.append(day_free)
+
+    data = {
+        "site": site.name,
+        "week": week.week_number,
+        "days": [day.isoformat() for day in working_days],
+        "periods": [[period.pk, period.name] for period in periods],
+        "categories": [[category.pk, category.name] for category in categories],
+        "items": items,
+        "classrooms": classrooms,
+        "free": free,
+        "reservation_fields": ["id", "day", "period", "item", "classroom", "units"],
+        "reservations": reservation_rows,
+    }
 
-    return best_item
+    return JsonResponse(data, json_dumps_params={'separators': (',', ':')})
 
 
-def render_reservation_request(request, request_date, selected_period, selected_item, item_inventory, category):
+def render_reservation_request(request, request_date, selected_period, selected_item, matrix: AvailabilityMatrix):
     user: User = request.user
     site: Site = user.site
 
@@ -161,6 +255,7 @@ def render_reservation_request(request, request_date, selected_period, selected_
         teams = Team.objects.filter(site=user.site)
     else:
         teams: List[Team] = Team.objects.filter(members__email=user.email).all()
+    teams = teams.select_related('subject').prefetch_related('members')
 
     if len(teams) == 0:
         logger.warning("[%s] User is not part of any teams, creating new team..", user.email)
@@ -169,22 +264,25 @@ def render_reservation_request(request, request_date, selected_period, selected_
         new_team.save()
         teams = [new_team]
 
-    classrooms: List[Classroom] = list(Classroom.objects.filter(site=selected_item.site))
+    classrooms: List[Classroom] = list(Classroom.objects.filter(site_id=selected_item.site_id))
     if len(classrooms) == 0:
         return error_redirect(request, "No classrooms have been set up at {}. Please contact your site director or "
                                        "administrator".format(site.name))
 
+    item_free: Dict[Period, int] = matrix.item_free(selected_item)
     context = {
-        "sites": Site.objects.all(),
+        "sites": get_sites(),
         "selected_item": selected_item,
-        "category_items": [item for item in site.siteinventory_set.filter(inventory__type=category) if
-                           item != selected_item],
+        "category_items": [item for item in matrix.items if item != selected_item],
         "request_date": request_date,
         "teams": teams,
         "selected_period": selected_period,
-        "free_units": item_inventory,
+        "free_units": item_free,
+        "period_units": [(period, free, matrix.category_free(period)) for period, free in item_free.items()],
         "classrooms": classrooms,
-        "purpose_list": UsagePurpose.objects.all(),
+        "purpose_list": get_purposes(),
+        "repeat_weeks": Week.objects.filter(site_id=selected_item.site_id, first_day__gt=request_date)
+            .order_by('week_number'),
     }
     return render(request, "checkout/request.html", context)
 
@@ -193,29 +291,30 @@ def render_reservation_request(request, request_date, selected_period, selected_
 def reserve_request(request):
     user: User = request.user
     request_date = datetime.strptime(request.GET.get('date'), '%Y-%m-%d').date()
-    selected_period: Period = get_object_or_404(Period, pk=request.GET.get('period'))
+    selected_period: Period = get_period(request.GET.get('period'))
+    if selected_period is None:
+        raise Http404("No period matches the given query.")
 
-    item_inventory: Dict[Period, int] = None
-    category: TechnologyCategory = None
     if 'site_inventory' in request.GET:
-        selected_item = SiteInventory.objects.get(pk=request.GET['site_inventory'])
-        category = selected_item.inventory.type
-        item_inventory = get_available_inventory(user.site, selected_item.inventory.type, request_date)[selected_item]
+        selected_item = SiteInventory.objects.select_related('inventory__type').get(pk=request.GET['site_inventory'])
+        matrix = get_availability_matrix(user.site, selected_item.inventory.type, request_date)
+        if selected_item.pk not in matrix.rows:
+            return error_redirect(request, "This item is not available at {}".format(user.site))
     elif 'technology_category' in request.GET:
-        category = TechnologyCategory.objects.get(pk=request.GET['technology_category'])
-        category_inventory = get_available_inventory(user.site, category, request_date)
-        selected_item = pick_inventory(category_inventory, selected_period)
+        category = get_category(request.GET['technology_category'])
+        if category is None:
+            raise Http404("No technology category matches the given query.")
+        matrix = get_availability_matrix(user.site, category, request_date)
+        selected_item = pick_item(matrix, selected_period)
         if not selected_item:
             logger.warning("No item could be selected for technology category %s in %s at site %s on date %s", category,
                            selected_period, user.site, request_date)
-            logger.warning("Available: %s", category_inventory)
+            logger.warning("Available: %s", dict(zip(matrix.items, matrix.free)))
             return error_redirect(request, "This type of item is no longer available, please try again.")
-
-        item_inventory = category_inventory[selected_item]
     else:
         return error_redirect(request, "Reservation request must contain site inventory or category")
 
-    return render_reservation_request(request, request_date, selected_period, selected_item, item_inventory, category)
+    return render_reservation_request(request, request_date, selected_period, selected_item, matrix)
 
 
 @login_required
@@ -230,7 +329,7 @@ def reserve(request):
     collaborative: bool = 'collaborative' in request.POST
 
     selected_periods = []
-    for period in sorted(Period.objects.all()):
+    for period in get_periods():
         checkbox_id = 'period_' + str(period.id)
 
         if checkbox_id in request.POST:
@@ -248,83 +347,323 @@ def reserve(request):
         return error_redirect(request,
                               "You must request at least 1 unit of {}".format(site_inventory.inventory.display_name))
 
-    # First, validate all the reservations
-    for period in selected_periods:
-        existing_reservations: List[Reservation] = list(Reservation.objects.filter(
-            site_inventory=site_inventory, date=request_date, period=period))
-        used_units = 0
-        for existing_reservation in existing_reservations:
-            used_units += existing_reservation.units
-        free_units = site_inventory.units - used_units
-
-        if requested_units > free_units:
-            return error_redirect(request, "Cannot reserve {} units of {} in {}, only {} are available".format(
-                requested_units, site_inventory.inventory.display_name, period.name, free_units))
-
-    # Then, create them all. This works because this entire handler is atomic.
-    reserved_periods: List[str] = []
-    for period in selected_periods:
-        logger.info("[%s] Creating reservation: Team: %s, Inventory: %s, Classroom: %s, Units: %s, Date: %s, Period %s",
-                    request.user.email, team, site_inventory, classroom, requested_units, request_date, period)
-
+    # A recurring reservation books the selected periods on every date of the recurrence, skipping any that fail
+    until_week: Week = None
+    if request.POST.get('repeat_until'):
         try:
-            Reservation.objects.create(
-                team=team,
-                site_inventory=site_inventory,
-                classroom=classroom,
-                units=requested_units,
-                date=request_date,
-                period=period,
-                purpose=purpose,
-                collaborative=collaborative,
-                creator=user,
-                comment=comment)
-        except IntegrityError:
-            return error_redirect(request, "Failed to make reservation - another reservation by this team for {} "
-                                           "in {} during {} already exists. Please delete the existing reservation and "
-                                           "try again".format(site_inventory.inventory.display_name, classroom.name,
-                                                              period.name))
-
-        reserved_periods.append(period.name)
-
-    messages.success(request, "Reservation confirmed for {} unit(s) of {} in {}".format(
-        requested_units, site_inventory.inventory.display_name, ", ".join(reserved_periods)))
+            until_week_number = int(request.POST['repeat_until'])
+        except ValueError:
+            return error_redirect(request, "Repeat until must be set to a valid week number")
+
+        until_week = get_object_or_404(Week, site=site_inventory.site, week_number=until_week_number)
+
+    try:
+        extra_dates: List[date] = parse_dates(request.POST.get('repeat_dates', ''))
+    except ValueError:
+        return error_redirect(request, "Additional dates must be given as YYYY-MM-DD, separated by commas")
+
+    recurring: bool = until_week is not None or len(extra_dates) > 0
+    reservation_dates: List[date] = [request_date]
+    if recurring:
+        reservation_dates = get_recurrence_dates(site_inventory.site, request_date, until_week, extra_dates)
+
+    slots: List[Slot] = [(slot_date, period) for slot_date in reservation_dates for period in selected_periods]
+    failed_slots: List[Tuple[date, Period, str]] = []
+
+    # Units can be split across the category's other items when the selected one doesn't have room for them all
+    allocation: Allocation = [(site_inventory, requested_units)]
+    if 'split_category' in request.POST and len(selected_periods) > 0:
+        if recurring:
+            return error_redirect(request, "Repeating reservations can't be split across items, please reserve a "
+                                           "single item or a single day")
+
+        matrix: AvailabilityMatrix = get_availability_matrix(site_inventory.site, site_inventory.inventory.type,
+                                                             request_date)
+        allocation = allocate_units(matrix, selected_periods, requested_units, site_inventory)
+        if allocation is None:
+            return error_redirect(request, "Cannot reserve {} units of {} in {}, only {} are available across all "
+                                           "items".format(requested_units, site_inventory.inventory.type.name,
+                                                          ", ".join(period.name for period in selected_periods),
+                                                          sum(matrix.free_in(selected_periods))))
+
+    # First, look for reservations this team already has in the selected slots, in one query, so the conflicting
+    # period can be named rather than discovered by a failed insert.
+    conflicting_slots = set(Reservation.objects
+                            .filter(team=team, site_inventory__in=[item for item, _ in allocation],
+                                    classroom=classroom, date__in=reservation_dates, period__in=selected_periods)
+                            .values_list('site_inventory_id', 'date', 'period_id'))
+    for item, _ in allocation:
+        for slot_date, period in slots:
+            if (item.pk, slot_date, period.pk) not in conflicting_slots:
+                continue
+
+            if not recurring:
+                return error_redirect(request, "Failed to make reservation - another reservation by this team for {} "
+                                               "in {} during {} already exists. Please delete the existing "
+                                               "reservation and try again".format(item.inventory.display_name,
+                                                                                 classroom.name, period.name))
+
+            failed_slots.append((slot_date, period, "already reserved by this team"))
+
+    slots = [(slot_date, period) for slot_date, period in slots
+             if (site_inventory.pk, slot_date, period.pk) not in conflicting_slots]
+
+    # Then, claim the units for all the slots at once. The claim locks the ledger entries, so concurrent requests
+    # can't overbook. A single day reservation is undone along with everything else if any period fails, while a
+    # recurring one goes ahead with the slots that have room.
+    if recurring:
+        shortfalls: List[InsufficientUnits] = claim_available_slots(site_inventory, slots, requested_units)
+        short_slots = {(shortfall.date, shortfall.period.pk) for shortfall in shortfalls}
+        failed_slots += [(shortfall.date, shortfall.period, "only {} available".format(shortfall.free_units))
+                         for shortfall in shortfalls]
+        slots = [(slot_date, period) for slot_date, period in slots if (slot_date, period.pk) not in short_slots]
+    else:
+        for item, item_units in allocation:
+            try:
+                claim_slots(item, slots, item_units)
+            except InsufficientUnits as e:
+                message = "Cannot reserve {} units of {} in {}, only {} are available".format(
+                    item_units, item.inventory.display_name, e.period.name, e.free_units)
+                transaction.set_rollback(True)
+                return error_redirect(request, message)
+
+    failed_message = "Could not reserve {} unit(s) of {} on: {}".format(
+        requested_units, site_inventory.inventory.display_name, "; ".join(
+            "{} {} ({})".format(slot_date.strftime("%a, %b %d"), period.name, reason)
+            for slot_date, period, reason in sorted(failed_slots, key=lambda failed_slot: failed_slot[:2])))
+    if len(slots) == 0:
+        return error_redirect(request, failed_message)
+
+    # Finally, create them all in one insert. This works because this entire handler is atomic.
+    reserved_periods: List[str] = [period.name for period in selected_periods if
+                                   any(slot_period == period for _, slot_period in slots)]
+    reserved_dates: List[date] = sorted({slot_date for slot_date, _ in slots})
+    reserved_items: str = site_inventory.inventory.display_name
+    if len(allocation) > 1:
+        reserved_items = ", ".join("{} ({})".format(item.inventory.display_name, item_units)
+                                   for item, item_units in allocation)
+
+    logger.info("[%s] Creating reservations: Team: %s, Inventory: %s, Classroom: %s, Units: %s, Dates: %s, Periods %s",
+                request.user.email, team,
+                ", ".join("{} x {}".format(item, item_units) for item, item_units in allocation), classroom,
+                requested_units, ", ".join(str(reserved_date) for reserved_date in reserved_dates),
+                ", ".join(reserved_periods))
+
+    new_reservations: List[Reservation] = [Reservation(
+        team=team,
+        site_inventory=item,
+        classroom=classroom,
+        units=item_units,
+        date=slot_date,
+        period=period,
+        purpose=purpose,
+        collaborative=collaborative,
+        creator=user,
+        comment=comment) for item, item_units in allocation for slot_date, period in slots]
+
+    try:
+        Reservation.objects.bulk_create(new_reservations)
+    except IntegrityError:
+        # A reservation for the same slot was created since the conflict check above
+        transaction.set_rollback(True)
+        return error_redirect(request, "Failed to make reservation - another reservation by this team for {} in {} "
+                                       "already exists. Please delete the existing reservation and try again"
+                                       .format(reserved_items, classroom.name))
+
+    reservations_created.send(sender=Reservation, reservations=new_reservations)
+
+    if recurring:
+        messages.success(request, "Reservation confirmed for {} unit(s) of {} in {} on {} day(s) between {} and {}"
+                         .format(requested_units, reserved_items, ", ".join(reserved_periods),
+                                 len(reserved_dates), reserved_dates[0].strftime("%a, %b %d"),
+                                 reserved_dates[-1].strftime("%a, %b %d")))
+        if len(failed_slots) > 0:
+            messages.error(request, failed_message)
+    else:
+        messages.success(request, "Reservation confirmed for {} unit(s) of {} in {}".format(
+            requested_units, reserved_items, ", ".join(reserved_periods)))
 
     # Figure out which week this was in
-    weeks: List[Week] = sorted(list(request.user.site.week_set.all()))
-    for week in weeks:
-        if week.start_date() <= request_date <= week.end_date():
-            return redirect('schedule', week.week_number)
+    week: Week = request.user.site.week_set.filter(first_day__lte=request_date, last_day__gte=request_date).first()
+    if week is not None:
+        return redirect('schedule', week.week_number)
 
     return redirect('index')
 
 
+SLOT_SEARCH_MAX_RESULTS = 50
+
+
 @login_required
-def reservations(request):
+def find_slots(request):
+    """
+    Searches the coming weeks for the earliest periods with enough free units of a technology category.
+    """
+    user: User = request.user
+    site: Site = user.site
+
+    periods: List[Period] = get_periods()
+    context = {
+        "sites": get_sites(),
+        "categories": TechnologyCategory.objects.filter(inventoryitem__siteinventory__site=site).distinct()
+            .order_by('name'),
+        "periods": periods,
+        "weekdays": list(enumerate(calendar.day_name)),
+        "slots": None,
+    }
+
+    if 'category' in request.GET:
+        category: TechnologyCategory = get_category(request.GET['category'])
+        if category is None:
+            raise Http404("No technology category matches the given query.")
+        try:
+            units = int(request.GET.get('units', ''))
+            limit = int(request.GET.get('limit', 10))
+            weekdays = [int(weekday) for weekday in request.GET.getlist('weekday')]
+        except (KeyError, ValueError):
+            return error_redirect(request, "Units and days must be valid numbers", reverse('slots'))
+
+        site_units: int = SiteInventory.objects.filter(site=site, inventory__type=category) \
+            .aggregate(total=Sum('units'))['total'] or 0
+        if not 1 <= units <= site_units:
+            return error_redirect(request, "Units must be between 1 and the {} {} units at {}".format(
+                site_units, category, site), reverse('slots'))
+        if any(weekday not in range(7) for weekday in weekdays):
+            return error_redirect(request, "Days must be valid days of the week", reverse('slots'))
+        limit = min(max(limit, 1), SLOT_SEARCH_MAX_RESULTS)
+
+        selected_periods = [period for period in periods if str(period.pk) in request.GET.getlist('period')]
+        context.update({
+            "category": category,
+            "units": units,
+            "selected_periods": selected_periods,
+            "selected_weekdays": weekdays,
+            "split": 'split' in request.GET,
+            "slots": find_available_slots(site, category, units, datetime.now().date(), selected_periods or None,
+                                          weekdays or None, limit, 'split' in request.GET),
+        })
+
+    return render(request, "checkout/slots.html", context)
+
+
+PAST_RESERVATIONS_PAGE_SIZE = 50
+
+
+def load_reservation_rows(request, reservation_list: List[Reservation]) -> List[Reservation]:
+    """
+    Attaches everything the reservation rows show - teams and their members, items, classrooms and periods - through
+    the request's identity map.
+    """
+    user: User = request.user
+    identity_map: IdentityMap = get_identity_map(request)
+    if not hasattr(request, '_user_teams'):
+        request._user_teams = identity_map.add_all(Team.objects.filter(members=user).prefetch_related('members'))
+
+    identity_map.attach(reservation_list, 'team')
+    identity_map.attach(reservation_list, 'site_inventory', SiteInventory.objects.select_related('inventory'))
+    identity_map.attach(reservation_list, 'classroom')
+    identity_map.attach(reservation_list, 'period')
+    return reservation_list
+
+
+def reservations_cursor(reservation: Reservation) -> str:
+    return "{}.{}.{}".format(reservation.date.isoformat(), reservation.period.number, reservation.pk)
+
+
+def get_past_reservations(request, cursor: str = None) -> Tuple[List[Reservation], Optional[str]]:
+    """
+    Returns a page of the user's past reservations, newest first, and the cursor for the next page (None if this is
+    the last one), including archived reservations. Pages start after the (date, period number, id) in the cursor
+    rather than at an offset, which the (team, date) index finds directly. Raises ValueError for a malformed cursor.
+    """
     user: User = request.user
+    before = Q()
+    if cursor:
+        cursor_date_str, cursor_number_str, cursor_pk_str = cursor.split('.')
+        cursor_date: date = datetime.strptime(cursor_date_str, '%Y-%m-%d').date()
+        cursor_number, cursor_pk = int(cursor_number_str), int(cursor_pk_str)
+        before = (Q(date__lt=cursor_date) |
+                  Q(date=cursor_date, period__number__lt=cursor_number) |
+                  Q(date=cursor_date, period__number=cursor_number, pk__lt=cursor_pk))
+
+    # Archived reservations keep their ids, so a page is the newest rows of both tables merged
+    page: List[Reservation] = []
+    for model in [Reservation, ArchivedReservation]:
+        page += list(model.objects
+                     .filter(before, team__members=user, date__lt=datetime.now().date())
+                     .order_by('-date', '-period__number', '-pk')[:PAST_RESERVATIONS_PAGE_SIZE + 1])
+    page = load_reservation_rows(request, page)
+    page = sorted(page, key=lambda reservation: (reservation.date, reservation.period.number, reservation.pk),
+                  reverse=True)[:PAST_RESERVATIONS_PAGE_SIZE + 1]
+    if len(page) > PAST_RESERVATIONS_PAGE_SIZE:
+        page = page[:PAST_RESERVATIONS_PAGE_SIZE]
+        return page, reservations_cursor(page[-1])
+
+    return page, None
 
-    teams: List[Team] = Team.objects.filter(members__email=user.email).all()
-    past_reservations: List[Reservation] = []
-    future_reservations: List[Reservation] = []
 
-    for team in teams:
-        for reservation in Reservation.objects.filter(team=team):
-            if reservation.date < datetime.now().date():
-                past_reservations.append(reservation)
-            else:
-                future_reservations.append(reservation)
+@login_required
+@condition(etag_func=page_etag(team_site_versions), last_modified_func=page_last_modified(team_site_versions))
+def reservations(request):
+    user: User = request.user
+
+    future_reservations: List[Reservation] = load_reservation_rows(request, list(
+        Reservation.objects
+            .filter(team__members=user, date__gte=datetime.now().date())
+            .order_by('date', 'period__number', 'pk')))
+    past_reservations, next_cursor = get_past_reservations(request)
 
     context = {
-        "sites": Site.objects.all(),
+        "sites": get_sites(),
         "user": user,
-        "past_reservations": sorted(past_reservations),
-        "future_reservations": sorted(future_reservations)
+        "past_reservations": past_reservations,
+        "future_reservations": future_reservations,
+        "next_cursor": next_cursor,
     }
 
     return render(request, "checkout/reservations.html", context)
 
 
 @login_required
+@condition(etag_func=page_etag(team_site_versions), last_modified_func=page_last_modified(team_site_versions))
+def past_reservations(request):
+    """
+    Renders the next page of past reservations as table rows, appended to the reservations page as the user scrolls
+    back through their history.
+    """
+    try:
+        reservation_list, next_cursor = get_past_reservations(request, request.GET.get('cursor'))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    return render(request, "checkout/reservation_rows.html",
+                  {"reservations": reservation_list, "next_cursor": next_cursor})
+
+
+@login_required
+def reservation_details(request, reservation_pk):
+    """
+    Renders the details and delete modals for a single reservation, loaded on demand by the schedule page. Only
+    reservations at the user's own site are shown, except to superusers.
+    """
+    user: User = request.user
+    reservations = Reservation.objects \
+        .select_related('team__subject', 'site_inventory__inventory', 'classroom', 'period', 'purpose', 'creator') \
+        .prefetch_related('team__members')
+    if not user.is_superuser:
+        reservations = reservations.filter(site_inventory__site=user.site)
+    reservation: Reservation = get_object_or_404(reservations, pk=reservation_pk)
+
+    context = {
+        "reservation": reservation,
+        "period": reservation.period,
+    }
+
+    return render(request, "checkout/reservation_details.html", context)
+
+
+@login_required
+@condition(etag_func=page_etag(site_versions), last_modified_func=page_last_modified(site_versions))
 def movements(request):
     user: User = request.user
 
@@ -333,6 +672,7 @@ def movements(request):
 
 
 @login_required
+@condition(etag_func=page_etag(site_versions), last_modified_func=page_last_modified(site_versions))
 def week_movements(request, week_number):
     user: User = request.user
     site: Site = user.site
@@ -362,11 +702,12 @@ def render_movements(request, week: Week):
         return HttpResponseBadRequest("At least one week must be configured for site %s. Please contact your "
                                       "administrator." % site.name)
 
-    schedule: List[MovementSchedule] = []
-    working_days = sorted(list(week.days()))
+    calendar_days: List[date] = week.calendar_days()
 
-    for day in working_days:
-        schedule.append(MovementSchedule(site, day))
+    def build_grid() -> ScheduleGrid:
+        working_days = sorted(list(week.days()))
+        schedule: List[MovementSchedule] = get_movement_schedules(site, working_days, get_identity_map(request))
+        return ScheduleGrid(get_movement_periods(), calendar_days, schedule)
 
     previous_week = (site.week_set.filter(week_number=week.week_number - 1).first(),)
     next_week = (site.week_set.filter(week_number=week.week_number + 1).first(),)
@@ -377,19 +718,19 @@ def render_movements(request, week: Week):
         next_week = (next_week[0], reverse('movements', args=[next_week[0].week_number]))
 
     context = {
-        "sites": Site.objects.all(),
+        "sites": get_sites(),
         "week": week,
         "previous_week": previous_week,
         "next_week": next_week,
-        "calendar_days": week.calendar_days(),
-        "periods": get_movement_periods(),
-        "schedule": schedule,
+        "calendar_days": calendar_days,
+        "grid": get_cached_grid('movements', site, week, build_grid),
     }
 
     return render(request, "checkout/week_movements.html", context)
 
 
 @login_required
+@transaction.atomic
 @require_http_post
 def delete(request):
     reservation: Reservation = get_object_or_404(Reservation, pk=request.POST['reservation_pk'])
@@ -417,53 +758,126 @@ def delete(request):
 
 @user_passes_test(lambda u: u.is_superuser)
 def export(request):
-    def generate_csv_output():
-        yield ','.join([
-            'Site', 'User', 'Teaching Team', 'Subject', 'Classroom', 'Date', 'Week', 'Period', 'Units', 'Type', 'SKU',
-            'Purpose', 'Collaborative', 'Total Teams at Site']) + '\n'
-
-        # Cache for performance, otherwise server timeouts can happen
-        site_teams: Dict[Site, int] = {}
-        site_weeks: Dict[Site, List[Week]] = {}
-        team_members: Dict[Team, List[User]] = {}
-        siteinventory_inventory: Dict[SiteInventory, InventoryItem] = {}
-
-        for reservation in Reservation.objects.all():
-            site: Site = reservation.site_inventory.site
-
-            if site not in site_weeks:
-                site_weeks[site] = site.week_set.all()
-            if site not in site_teams:
-                site_teams[site] = len(site.team_set.all())
-            if reservation.team not in team_members:
-                team_members[reservation.team] = reservation.team.members.all()
-            if reservation.site_inventory not in siteinventory_inventory:
-                siteinventory_inventory[reservation.site_inventory] = reservation.site_inventory.inventory
-
-            weeks: List[Week] = site_weeks[site]
-            week_number = 0
-            for week in weeks:
-                if reservation.date in week.days():
-                    week_number = week.week_number
-
-            yield ','.join([str(cell) for cell in [
-                site.name,
-                reservation.creator.name + " (" + reservation.creator.email + ")",
-                ", ".join([member.name for member in team_members[reservation.team]]),
-                reservation.team.subject.name,
-                reservation.classroom.name,
-                reservation.date,
-                week_number,
-                reservation.period.number,
-                reservation.units,
-                siteinventory_inventory[reservation.site_inventory].type.name,
-                siteinventory_inventory[reservation.site_inventory].display_name,
-                reservation.purpose.purpose if reservation.purpose else UsagePurpose.OTHER_PURPOSE,
-                1 if reservation.collaborative else 0,
-                site_teams[site]
-            ]]) + '\n'
-
-    return StreamingHttpResponse(generate_csv_output(), status=200, content_type='text/csv')
+    """
+    Exports reservations as CSV, optionally only those matching the filters in checkout.export.EXPORT_FILTERS. With
+    page_size, the export comes in pages of that many reservations in order of modification, and every page but the
+    last has an X-Export-Cursor header - passing it back as cursor fetches the next page of the same export.
+
+    An export with modified_since only has the reservations created or changed since then. Deleted reservations
+    aren't reported at all, so anything kept in sync from incremental exports needs a full export from time to time
+    to drop them. Archiving doesn't count as a change: archived reservations stay in the export as they were.
+
+    A POST queues the export as a background job instead (see export_jobs), with format csv or xlsx.
+    """
+    if request.method == 'POST':
+        try:
+            job = enqueue_export_job(request.user, get_export_filters(request.POST), request.POST.get('format', 'csv'))
+        except ValueError as e:
+            return error_redirect(request, "Could not queue export: {}".format(e), reverse('export_jobs'))
+
+        logger.info("[%s] Queued export job %s", request.user.email, job.pk)
+        messages.success(request, "Export queued, it can be downloaded here when it is done")
+        return redirect('export_jobs')
+
+    try:
+        if request.GET.get('cursor'):
+            filters, page_size, position = load_export_cursor(request.GET['cursor'])
+        else:
+            filters = get_export_filters(request.GET)
+            page_size = int(request.GET['page_size']) if request.GET.get('page_size') else None
+            position = None
+        querysets = get_export_querysets(filters)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid export filters or cursor")
+
+    next_position = None
+    if page_size is not None:
+        if not 0 < page_size <= EXPORT_MAX_PAGE_SIZE:
+            return HttpResponseBadRequest("page_size must be between 1 and {}".format(EXPORT_MAX_PAGE_SIZE))
+        querysets, next_position = get_export_page(querysets, position, page_size)
+
+    response = StreamingHttpResponse(export_csv(export_rows(querysets)), status=200, content_type='text/csv')
+    if next_position is not None:
+        response['X-Export-Cursor'] = dump_export_cursor(filters, page_size, next_position)
+    return response
+
+
+EXPORT_JOBS_SHOWN = 20
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def export_jobs(request):
+    """
+    Lists the latest background exports with their progress and download links, and queues new ones.
+    """
+    jobs: List[ExportJob] = list(ExportJob.objects.select_related('requested_by').order_by('-pk')[:EXPORT_JOBS_SHOWN])
+
+    context = {
+        "sites": get_sites(),
+        "categories": get_categories(),
+        "formats": ExportJob.FORMATS,
+        "jobs": jobs,
+        "in_progress": any(job.status in (ExportJob.QUEUED, ExportJob.RUNNING) for job in jobs),
+    }
+
+    return render(request, "checkout/export_jobs.html", context)
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def export_job_download(request, job_pk):
+    job: ExportJob = get_object_or_404(ExportJob, pk=job_pk, status=ExportJob.DONE)
+    try:
+        export_file = open(get_export_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404("The file for export {} no longer exists".format(job.pk))
+
+    content_type = 'text/csv' if job.format == ExportJob.CSV else \
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    response = FileResponse(export_file, content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(job.file_name)
+    return response
+
+
+DISTRICT_MOVEMENTS_MAX_DAYS = 31
+
+
+@user_passes_test(lambda u: u.is_superuser)
+def district_movements(request):
+    """
+    Lists the movements of every site between two days (tomorrow by default), as a printable page or, with
+    format=csv, as a CSV download. Sites are planned one at a time, in this process and from stored plans where
+    there are any, and each is added to the response as soon as it is done. 'python manage.py district_movements'
+    plans them in parallel instead.
+    """
+    tomorrow: date = datetime.now().date() + timedelta(days=1)
+    try:
+        start_date: date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date() \
+            if request.GET.get('start') else tomorrow
+        end_date: date = datetime.strptime(request.GET['end'], '%Y-%m-%d').date() \
+            if request.GET.get('end') else start_date
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be given as YYYY-MM-DD")
+
+    if not start_date <= end_date < start_date + timedelta(days=DISTRICT_MOVEMENTS_MAX_DAYS):
+        return HttpResponseBadRequest("The end date must be on or after the start date, and at most {} days "
+                                      "later".format(DISTRICT_MOVEMENTS_MAX_DAYS - 1))
+
+    logger.info("[%s] Processing district movements from %s to %s", request.user.email, start_date, end_date)
+    site_rows = get_district_movement_rows(start_date, end_date)
+
+    if request.GET.get('format') == 'csv':
+        response = StreamingHttpResponse(district_report_csv(site_rows), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="movements-{}-{}.csv"'.format(
+            start_date.isoformat(), end_date.isoformat())
+        return response
+
+    context = {
+        "sites": get_sites(),
+        "start_date": start_date,
+        "end_date": end_date,
+    }
+
+    return StreamingHttpResponse(district_report_html(site_rows, context, request), content_type='text/html')
 
 
 @user_passes_test(lambda u: u.is_superuser)
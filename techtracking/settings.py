@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'checkout.reference_data.ReferenceDataMiddleware',
     'techtracking.error_utils.ExceptionLoggingMiddleware'
 ]
 
@@ -81,6 +82,31 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'techtracking',
+    }
+}
+
+# Rendered week grids are cached per site data version, so they never go stale - this only bounds memory use
+SCHEDULE_CACHE_TIMEOUT = 60 * 60
+
+# Reservations older than this are moved to the archive by 'python manage.py archive_reservations'
+RESERVATION_ARCHIVE_AFTER_DAYS = 365
+
+# How the movements page plans moves: 'greedy', or 'optimal' to move as few units as possible
+# (see checkout.movement_schedule)
+MOVEMENT_PLANNER = 'greedy'
+
+# Where 'python manage.py run_export_jobs' writes background exports, served to superusers from the export page. Must
+# be readable by the web server.
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', os.path.join(BASE_DIR, 'exports'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
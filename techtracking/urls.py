@@ -21,13 +21,21 @@ import checkout.views
 urlpatterns = [
     url(r'^$', checkout.views.index, name='index'),
     url(r'^week/(?P<week_number>[0-9]+)$', checkout.views.week_schedule, name='schedule'),
+    url(r'^week/(?P<week_number>[0-9]+)/availability$', checkout.views.week_availability, name='availability'),
     url(r'^request/', checkout.views.reserve_request, name='reserve_request'),
     url(r'^reserve/', checkout.views.reserve, name='reserve'),
+    url(r'^slots/', checkout.views.find_slots, name='slots'),
+    url(r'^reservations/past$', checkout.views.past_reservations, name='past_reservations'),
     url(r'^reservations/', checkout.views.reservations, name='reservations'),
+    url(r'^reservation/(?P<reservation_pk>[0-9]+)$', checkout.views.reservation_details,
+        name='reservation_details'),
     url(r'^movements/(?P<week_number>[0-9]+)$', checkout.views.week_movements, name='movements'),
     url(r'^movements/', checkout.views.movements, name='movements'),
     url(r'^delete/', checkout.views.delete, name='delete'),
+    url(r'^export/jobs/(?P<job_pk>[0-9]+)$', checkout.views.export_job_download, name='export_job_download'),
+    url(r'^export/jobs/', checkout.views.export_jobs, name='export_jobs'),
     url(r'^export/', checkout.views.export, name='export'),
+    url(r'^district_movements/', checkout.views.district_movements, name='district_movements'),
     url(r'^change_site/', checkout.views.change_site, name='change_site'),
     url(r'^admin/', admin.site.urls),
     url(r'^accounts/', include('django.contrib.auth.urls')),